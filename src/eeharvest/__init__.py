@@ -1,7 +1,6 @@
+import importlib
 import sys
 
-from eeharvest.harvester import collect, initialise, initialize, auto  # noqa: F401
-
 if sys.version_info[:2] >= (3, 8):
     # TODO: Import directly (no need for conditional) when `python_requires = >= 3.8`
     from importlib.metadata import PackageNotFoundError, version  # pragma: no cover
@@ -16,3 +15,17 @@ except PackageNotFoundError:  # pragma: no cover
     __version__ = "unknown"
 finally:
     del version, PackageNotFoundError
+
+# The harvester pulls in Earth Engine and its add-ons, which are slow to
+# import, so it is only loaded when one of its functions is first used
+_harvester_attrs = ("collect", "initialise", "initialize", "auto", "auto_async")
+
+
+def __getattr__(name):
+    if name in _harvester_attrs:
+        return getattr(importlib.import_module("eeharvest.harvester"), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_harvester_attrs))
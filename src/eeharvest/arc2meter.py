@@ -30,3 +30,25 @@ def calc_arc2meter(arcsec, latitude):
     meter_lng = arcsec * np.cos(latitude * np.pi / 180) * 30.922
     meter_lat = arcsec * 30.87
     return (meter_lng, meter_lat)
+
+
+def calc_meter2deg(meters, latitude):
+    """
+    Calculate meter to decimal degrees
+
+    Inverse of `calc_arc2meter`, in degrees instead of arc seconds. Works on
+    scalars and on numpy arrays of latitudes alike.
+
+    Input
+    -----
+    meters: float or array, meters
+    latitude: float or array, latitude
+
+    Return
+    ------
+    (degrees Long, degrees Lat)
+    """
+    latitude = np.asarray(latitude, dtype=float)
+    deg_lng = meters / (np.cos(latitude * np.pi / 180) * 30.922 * 3600)
+    deg_lat = meters / (30.87 * 3600) * np.ones_like(latitude)
+    return (deg_lng, deg_lat)
@@ -0,0 +1,335 @@
+"""
+Local caching of remote resources used by eeharvest.
+
+JSON documents such as the Earth Engine catalog and the Awesome Spectral
+Indices dictionary are cached at three levels:
+
+1. in memory, so repeated calls in one session cost nothing
+2. on disk, in `EEHARVEST_CACHE_DIR` (default: ~/.cache/eeharvest), and
+   revalidated with the server using ETags once they are older than the TTL
+3. as a snapshot bundled in `eeharvest.data`, used when there is no network
+   and nothing has been cached yet
+
+Downloads are cached by content: files are named after a hash of the full
+Earth Engine computation graph, region, CRS and scale, and tracked in a
+manifest in the download folder (see `DownloadCache`).
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from urllib.error import HTTPError
+
+from importlib_resources import files
+
+from eeharvest import metrics, msg
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows, where manifests are only shared by threads
+    fcntl = None
+
+# Time in seconds before a cached document is revalidated, by default 7 days
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+_memo = {}
+_memo_lock = threading.Lock()
+
+
+def cache_dir():
+    """Return the cache directory, creating it if needed"""
+    path = os.environ.get(
+        "EEHARVEST_CACHE_DIR",
+        os.path.join(os.path.expanduser("~"), ".cache", "eeharvest"),
+    )
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _ttl():
+    """Return the cache TTL in seconds, which can be set with EEHARVEST_CACHE_TTL"""
+    return float(os.environ.get("EEHARVEST_CACHE_TTL", DEFAULT_TTL))
+
+
+def _write_json(path, obj):
+    """Write JSON to a temporary file and move it into place atomically"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def fetch_json(url, name, ttl=None, snapshot=None, timeout=30):
+    """
+    Return the JSON document at `url`, using the cache whenever possible
+
+    Parameters
+    ----------
+    url : str
+        URL of the JSON document
+    name : str
+        Name of the cache entry, also used as the file name on disk
+    ttl : float, optional
+        Age in seconds after which the disk cache is revalidated with the
+        server. If None, `EEHARVEST_CACHE_TTL` or 7 days is used, by default
+        None
+    snapshot : str, optional
+        Name of a file in `eeharvest.data` to fall back to when the document
+        cannot be downloaded and has not been cached, by default None
+    timeout : int, optional
+        Timeout in seconds for the request, by default 30
+
+    Returns
+    -------
+    dict or list
+        The parsed JSON document
+    """
+    with _memo_lock:
+        if name in _memo:
+            return _memo[name]
+    ttl = _ttl() if ttl is None else ttl
+    path = os.path.join(cache_dir(), f"{name}.json")
+    meta_path = os.path.join(cache_dir(), f"{name}.meta.json")
+    try:
+        meta = _read_json(meta_path)
+    except (FileNotFoundError, ValueError):
+        meta = {}
+    cached = os.path.exists(path) and meta.get("url") == url
+    data = None
+    if cached and time.time() - meta.get("checked", 0) < ttl:
+        data = _read_json(path)
+    else:
+        request = urllib.request.Request(url)
+        if cached and meta.get("etag"):
+            request.add_header("If-None-Match", meta["etag"])
+        error = None
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                data = json.loads(response.read().decode())
+                etag = response.headers.get("ETag")
+            _write_json(path, data)
+            _write_json(meta_path, {"url": url, "etag": etag, "checked": time.time()})
+        except HTTPError as e:
+            if e.code == 304 and cached:
+                # Not modified, so the cached copy is good for another TTL
+                data = _read_json(path)
+                meta["checked"] = time.time()
+                _write_json(meta_path, meta)
+            else:
+                error = e
+        except (OSError, ValueError) as e:
+            error = e
+        if error is not None:
+            if not cached and snapshot is None:
+                raise error
+            msg.warn(f"Could not download {name} ({error}), using local copy")
+            if cached:
+                data = _read_json(path)
+            else:
+                snapshot = files("eeharvest.data").joinpath(snapshot)
+                data = json.loads(snapshot.read_text())
+    with _memo_lock:
+        _memo[name] = data
+    return data
+
+
+def clear(disk=False):
+    """
+    Clear the in-memory cache, and optionally the cached files on disk
+    """
+    with _memo_lock:
+        _memo.clear()
+    if disk:
+        for f in os.listdir(cache_dir()):
+            if f.endswith(".json"):
+                os.remove(os.path.join(cache_dir(), f))
+
+
+def download_key(image, region, crs, scale):
+    """
+    Return a key that identifies a download by its content
+
+    The key is a hash of the serialised Earth Engine expression of `image`
+    (which includes every preprocessing step), the region, the CRS and the
+    scale. Identical requests produce the same key, and any change to them
+    produces a different one.
+
+    Parameters
+    ----------
+    image : obj
+        ee.Image or ee.ImageCollection object
+    region : obj
+        ee.Geometry object or a list of coordinates
+    crs : str
+        Coordinate reference system
+    scale : float
+        Scale in metres
+
+    Returns
+    -------
+    str
+        A 16-character hexadecimal key
+    """
+    try:
+        region = region.serialize()
+    except AttributeError:
+        region = json.dumps(list(region))
+    content = "|".join([image.serialize(), region, str(crs), str(scale)])
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+def _size(path):
+    """Size of a file, or of all files in a folder, in bytes"""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, f))
+            for root, _, filenames in os.walk(path)
+            for f in filenames
+        )
+    return os.path.getsize(path)
+
+
+class DownloadCache:
+    """
+    A manifest of downloaded files in a folder, with least recently used
+    (LRU) eviction
+
+    The manifest is stored as ".eeharvest_cache.json" in the download folder
+    and records the size and last access time of every file that eeharvest
+    has downloaded there, as well as hit and miss counts. It is updated under
+    a lock file, ".eeharvest_cache.lock", so that several processes can
+    download into the same folder.
+
+    Attributes
+    ----------
+    directory : str
+        The download folder
+    max_size : int
+        Maximum total size of the cached downloads in bytes. The least
+        recently used files are deleted when it is exceeded. If None, files
+        are never deleted
+    hits : int
+        Number of downloads found in the cache by this object
+    misses : int
+        Number of downloads not found in the cache by this object
+    """
+
+    _locks = {}
+    _locks_lock = threading.Lock()
+
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.manifest_path = os.path.join(directory, ".eeharvest_cache.json")
+        self.lock_path = os.path.join(directory, ".eeharvest_cache.lock")
+        self.hits = 0
+        self.misses = 0
+        with DownloadCache._locks_lock:
+            key = os.path.abspath(directory)
+            self._lock = DownloadCache._locks.setdefault(key, threading.Lock())
+
+    @contextmanager
+    def _locked(self):
+        """Lock the manifest against other threads and processes"""
+        with self._lock, open(self.lock_path, "a") as f:
+            # The manifest itself is replaced on every write, so a separate
+            # file is locked. The lock is released when the file is closed.
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _load(self):
+        try:
+            return _read_json(self.manifest_path)
+        except (FileNotFoundError, ValueError):
+            return {"files": {}, "stats": {"hits": 0, "misses": 0}}
+
+    def get(self, filename):
+        """
+        Return the path to `filename` if it is in the cache, otherwise None
+        """
+        path = os.path.join(self.directory, filename)
+        with self._locked():
+            manifest = self._load()
+            entry = manifest["files"].get(filename)
+            hit = entry is not None and os.path.exists(path)
+            if hit:
+                entry["accessed"] = time.time()
+                self.hits += 1
+                manifest["stats"]["hits"] += 1
+            else:
+                manifest["files"].pop(filename, None)
+                self.misses += 1
+                manifest["stats"]["misses"] += 1
+            _write_json(self.manifest_path, manifest)
+        metrics.record_cache(hit)
+        return path if hit else None
+
+    def put(self, filename):
+        """
+        Add a downloaded file (or folder) to the cache and evict the least
+        recently used files if the cache is larger than `max_size`
+        """
+        path = os.path.join(self.directory, filename)
+        with self._locked():
+            manifest = self._load()
+            now = time.time()
+            manifest["files"][filename] = {
+                "size": _size(path),
+                "created": now,
+                "accessed": now,
+            }
+            evicted = self._evict(manifest, keep=filename)
+            _write_json(self.manifest_path, manifest)
+        for f in evicted:
+            msg.info(f"Removed {f} from download cache (size limit reached)")
+        return path
+
+    def _evict(self, manifest, keep=None):
+        """Delete least recently used files until the cache fits `max_size`"""
+        evicted = []
+        if self.max_size is None:
+            return evicted
+        files = manifest["files"]
+        total = sum(i["size"] for i in files.values())
+        for f in sorted(files, key=lambda f: files[f]["accessed"]):
+            if total <= self.max_size:
+                break
+            if f == keep:
+                continue
+            path = os.path.join(self.directory, f)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+            total -= files.pop(f)["size"]
+            evicted.append(f)
+        return evicted
+
+    def stats(self):
+        """
+        Return cache statistics: hits and misses of this object, lifetime hits
+        and misses of the folder, number of files and total size in bytes
+        """
+        with self._locked():
+            manifest = self._load()
+        files = manifest["files"]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": manifest["stats"]["hits"],
+            "total_misses": manifest["stats"]["misses"],
+            "files": len(files),
+            "size": sum(i["size"] for i in files.values()),
+        }
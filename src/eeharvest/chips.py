@@ -0,0 +1,283 @@
+"""
+Extraction of image chips around points, e.g. for machine learning datasets.
+
+A chip is a small square array of pixels centred on a point. The pixel grid
+of every chip is computed locally for all points at once (see `grids()`),
+and each chip is fetched with one `ee.data.computePixels()` request. Chips
+are written to a single dataset together with their point IDs by
+`ChipWriter`, instead of one file per chip, in one of these formats:
+
+- "npz": a folder of NumPy .npz shards of up to `shard_size` chips each
+- "zarr": a chunked Zarr store (requires `zarr`)
+- "hdf5": a chunked HDF5 file (requires `h5py`)
+
+Every format holds the arrays "chips" (points x bands x rows x columns,
+float32, with NaN for masked pixels), "point_id", "lng" and "lat", and the
+band names.
+"""
+
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from eeharvest import arc2meter, ratelimit
+
+FORMATS = ("npz", "zarr", "hdf5")
+
+# Name of the band added to each request to tell masked pixels apart
+VALID_BAND = "_valid"
+
+
+def grids(lng, lat, size, scale):
+    """
+    Pixel grids of `size` x `size` pixels of about `scale` metres, centred on
+    points in WGS84
+
+    The pixel size in degrees is calculated for all latitudes at once with
+    `arc2meter.calc_meter2deg()`, so chips cover the same ground distance
+    everywhere.
+
+    Returns
+    -------
+    list of dict
+        One `grid` parameter of `ee.data.computePixels()` per point
+    """
+    lng = np.asarray(lng, dtype=float)
+    lat = np.asarray(lat, dtype=float)
+    dx, dy = arc2meter.calc_meter2deg(scale, lat)
+    left = lng - dx * size / 2
+    top = lat + dy * size / 2
+    return [
+        {
+            "dimensions": {"width": size, "height": size},
+            "affineTransform": {
+                "scaleX": float(x),
+                "shearX": 0,
+                "translateX": float(x0),
+                "shearY": 0,
+                "scaleY": -float(y),
+                "translateY": float(y0),
+            },
+            "crsCode": "EPSG:4326",
+        }
+        for x, y, x0, y0 in zip(dx, dy, left, top)
+    ]
+
+
+def fetch(image, grid, bands):
+    """
+    Fetch the pixels of `image` on `grid` with one computePixels request
+
+    `image` must include the `VALID_BAND` added by `prepare()`.
+
+    Returns
+    -------
+    numpy.ndarray
+        A float32 array of bands x rows x columns, NaN where masked
+    """
+    import ee
+
+    data = ratelimit.call(
+        ee.data.computePixels,
+        {
+            "expression": image,
+            "fileFormat": "NUMPY_NDARRAY",
+            "bandIds": list(bands) + [VALID_BAND],
+            "grid": grid,
+        },
+    )
+    chip = np.stack([data[b].astype("float32") for b in bands])
+    chip[:, data[VALID_BAND] == 0] = np.nan
+    return chip
+
+
+def prepare(image):
+    """Add the `VALID_BAND` of `image`, which is 1 where all bands are valid"""
+    import ee
+
+    valid = image.mask().reduce(ee.Reducer.min()).rename(VALID_BAND)
+    return image.toFloat().addBands(valid.toFloat())
+
+
+def circle(size):
+    """A boolean mask of the pixels inside the circle that fits a chip"""
+    centre = (size - 1) / 2
+    rows, cols = np.ogrid[:size, :size]
+    return (rows - centre) ** 2 + (cols - centre) ** 2 <= (size / 2) ** 2
+
+
+def format_of(path):
+    """The chip format implied by the extension of `path`"""
+    if path.endswith(".zarr"):
+        return "zarr"
+    if path.endswith((".h5", ".hdf5")):
+        return "hdf5"
+    return "npz"
+
+
+class ChipWriter:
+    """
+    Write chips to a set of NPZ shards, a Zarr store or an HDF5 file
+
+    Chips can be written from several threads. The output is written under a
+    temporary name and only moved into place when the writer is closed
+    without errors.
+
+    Attributes
+    ----------
+    path : str
+        Path to the output folder (NPZ), store (Zarr) or file (HDF5)
+    format : str
+        One of `FORMATS`, from the extension of `path`
+    rows : int
+        Number of chips written
+    """
+
+    def __init__(self, path, bands, size, shard_size=1024):
+        self.path = path
+        self.format = format_of(path)
+        self.bands = list(bands)
+        self.size = size
+        self.shard_size = shard_size
+        self.rows = 0
+        self._part = path + ".part"
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._shards = 0
+        self._store = None
+        if self.format == "zarr":
+            try:
+                import zarr  # noqa: F401
+            except ImportError:
+                raise ImportError("Writing Zarr stores requires `zarr`")
+        elif self.format == "hdf5":
+            try:
+                import h5py  # noqa: F401
+            except ImportError:
+                raise ImportError("Writing HDF5 files requires `h5py`")
+        # A previous `path` is kept until this output replaces it
+        _remove(self._part)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+    def write(self, point_id, lng, lat, chip):
+        """Add one chip of bands x rows x columns"""
+        with self._lock:
+            self._buffer.append((point_id, lng, lat, chip))
+            self.rows += 1
+            if len(self._buffer) >= self.shard_size:
+                self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        point_id, lng, lat, chips = zip(*self._buffer)
+        arrays = {
+            "chips": np.stack(chips).astype("float32"),
+            "point_id": np.asarray(point_id, dtype="int64"),
+            "lng": np.asarray(lng, dtype="float64"),
+            "lat": np.asarray(lat, dtype="float64"),
+        }
+        self._buffer = []
+        if self.format == "npz":
+            os.makedirs(self._part, exist_ok=True)
+            shard = os.path.join(self._part, f"chips_{self._shards:05d}.npz")
+            np.savez(shard, bands=np.asarray(self.bands), **arrays)
+            self._shards += 1
+        else:
+            if self._store is None:
+                self._store = self._create()
+            for name, array in arrays.items():
+                self._append(self._store[name], array)
+
+    def _create(self):
+        """Create the Zarr store or HDF5 file with empty, growable arrays"""
+        shape = (len(self.bands), self.size, self.size)
+        specs = {
+            "chips": ((0,) + shape, (1,) + shape, "float32"),
+            "point_id": ((0,), (self.shard_size,), "int64"),
+            "lng": ((0,), (self.shard_size,), "float64"),
+            "lat": ((0,), (self.shard_size,), "float64"),
+        }
+        if self.format == "zarr":
+            import zarr
+
+            store = zarr.open_group(self._part, mode="w")
+            # zarr 3 renamed create_dataset() to create_array()
+            create = getattr(store, "create_array", None) or store.create_dataset
+            for name, (empty, chunks, dtype) in specs.items():
+                create(name, shape=empty, chunks=chunks, dtype=dtype)
+        else:
+            import h5py
+
+            store = h5py.File(self._part, "w")
+            for name, (empty, chunks, dtype) in specs.items():
+                store.create_dataset(
+                    name,
+                    shape=empty,
+                    maxshape=(None,) + empty[1:],
+                    chunks=chunks,
+                    dtype=dtype,
+                    compression="gzip",
+                )
+        store.attrs["bands"] = self.bands
+        return store
+
+    def _append(self, dataset, array):
+        if self.format == "zarr":
+            dataset.append(array)
+        else:
+            start = dataset.shape[0]
+            dataset.resize(start + len(array), axis=0)
+            dataset[start:] = array
+
+    def close(self, discard=False):
+        """Finish the output, or delete it if `discard` is True"""
+        with self._lock:
+            if not discard:
+                self._flush()
+                if self.format == "npz":
+                    os.makedirs(self._part, exist_ok=True)
+                elif self._store is None:
+                    # Nothing was written, but leave an empty dataset behind
+                    self._store = self._create()
+            if self.format == "hdf5" and self._store is not None:
+                self._store.close()
+            self._store = None
+            if discard:
+                _remove(self._part)
+                return
+            # Folders and stores cannot be replaced in one step
+            _remove(self.path)
+            os.replace(self._part, self.path)
+
+
+def _remove(path):
+    """Delete a file or folder, if it exists"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def read_npz(path):
+    """
+    Read a folder of NPZ shards written by `ChipWriter` into one dict of
+    arrays
+    """
+    shards = sorted(f for f in os.listdir(path) if f.endswith(".npz"))
+    parts = [np.load(os.path.join(path, f)) for f in shards]
+    if not parts:
+        return {}
+    data = {
+        name: np.concatenate([p[name] for p in parts])
+        for name in ("chips", "point_id", "lng", "lat")
+    }
+    data["bands"] = list(parts[0]["bands"])
+    return data
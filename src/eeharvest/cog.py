@@ -0,0 +1,223 @@
+"""
+Post-processing of downloaded GeoTIFFs into Cloud-Optimized GeoTIFFs (COGs).
+
+Earth Engine returns GeoTIFFs in whatever layout it chooses. `convert()`
+rewrites them as compressed, internally tiled COGs with overview pyramids,
+in a pool of processes, so that downstream readers do not need another
+full pass to re-tile and re-compress them. Each file is written to a
+temporary file and moved into place atomically.
+
+GDAL's COG driver (GDAL >= 3.1) is used when it is available. Otherwise a
+tiled GeoTIFF is written window by window, its overviews are built and it is
+copied with a COG layout. Either way GDAL streams the data in blocks, so
+memory use is bounded by `cache_mb` rather than by the size of the file.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from eeharvest import msg
+
+# Options accepted by `to_cog()`, used to validate the `cog` config setting
+OPTIONS = (
+    "compress",
+    "level",
+    "predictor",
+    "blocksize",
+    "overviews",
+    "resampling",
+    "cache_mb",
+)
+
+# GDAL COG driver names for the TIFF predictors
+_COG_PREDICTORS = {None: "YES", 1: "NO", 2: "STANDARD", 3: "FLOATING_POINT"}
+
+# GTiff driver options that set the compression level
+_GTIFF_LEVELS = {"deflate": "zlevel", "zstd": "zstd_level", "lzma": "lzma_preset"}
+
+
+def to_cog(
+    path,
+    compress="deflate",
+    level=None,
+    predictor=None,
+    blocksize=512,
+    overviews=True,
+    resampling="average",
+    cache_mb=256,
+):
+    """
+    Rewrite a GeoTIFF as a Cloud-Optimized GeoTIFF, in place
+
+    Parameters
+    ----------
+    path : str
+        Path to the GeoTIFF
+    compress : str, optional
+        Compression method, e.g. "deflate", "zstd" or "lzw", by default
+        "deflate"
+    level : int, optional
+        Compression level. If None, GDAL's default for `compress` is used, by
+        default None
+    predictor : int, optional
+        TIFF predictor: 1 (none), 2 (horizontal differencing, for integers) or
+        3 (floating point). If None, it is chosen from the data type, by
+        default None
+    blocksize : int, optional
+        Width and height of the internal tiles in pixels, a multiple of 16, by
+        default 512
+    overviews : bool, optional
+        Build overviews (reduced resolution copies) down to the size of one
+        tile, by default True
+    resampling : str, optional
+        Resampling method of the overviews, e.g. "average", "nearest" or
+        "mode", by default "average"
+    cache_mb : int, optional
+        GDAL block cache size in megabytes, which bounds memory use, by
+        default 256
+
+    Returns
+    -------
+    str
+        Path to the COG
+    """
+    import rasterio
+
+    if blocksize % 16 != 0:
+        raise ValueError("`blocksize` must be a multiple of 16")
+    part = os.path.splitext(path)[0] + ".cog.part.tif"
+    try:
+        with rasterio.Env(GDAL_CACHEMAX=cache_mb) as env:
+            if "COG" in env.drivers():
+                _copy_cog(
+                    path,
+                    part,
+                    compress,
+                    level,
+                    predictor,
+                    blocksize,
+                    overviews,
+                    resampling,
+                )
+            else:
+                _copy_tiled(
+                    path,
+                    part,
+                    compress,
+                    level,
+                    predictor,
+                    blocksize,
+                    overviews,
+                    resampling,
+                )
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return path
+
+
+def _copy_cog(src, dst, compress, level, predictor, blocksize, overviews, resampling):
+    """Write `src` to `dst` with the GDAL COG driver"""
+    from rasterio.shutil import copy
+
+    options = {
+        "compress": compress.upper(),
+        "predictor": _COG_PREDICTORS[predictor],
+        "blocksize": blocksize,
+        "overviews": "AUTO" if overviews else "NONE",
+        "resampling": resampling.upper(),
+        "bigtiff": "IF_SAFER",
+    }
+    if level is not None:
+        options["level"] = level
+    copy(src, dst, driver="COG", **options)
+
+
+def _copy_tiled(src, dst, compress, level, predictor, blocksize, overviews, resampling):
+    """
+    Write `src` to `dst` as a COG without the GDAL COG driver
+
+    A tiled GeoTIFF is written window by window and its overviews are built,
+    then it is copied to `dst` with the overviews ahead of the image data.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.shutil import copy
+
+    tmp = os.path.splitext(dst)[0] + ".tiled.tif"
+    try:
+        with rasterio.open(src) as source:
+            if predictor is None:
+                predictor = 3 if source.dtypes[0].startswith("float") else 2
+            options = {
+                "tiled": True,
+                "blockxsize": blocksize,
+                "blockysize": blocksize,
+                "compress": compress,
+                "predictor": predictor,
+                "bigtiff": "IF_SAFER",
+            }
+            if level is not None and compress.lower() in _GTIFF_LEVELS:
+                options[_GTIFF_LEVELS[compress.lower()]] = level
+            profile = dict(source.profile, driver="GTiff", **options)
+            with rasterio.open(tmp, "w", **profile) as target:
+                for _, window in target.block_windows(1):
+                    target.write(source.read(window=window), window=window)
+                if overviews:
+                    factors = []
+                    size = min(target.width, target.height)
+                    while size // 2 ** (len(factors) + 1) >= blocksize // 2:
+                        factors.append(2 ** (len(factors) + 1))
+                    if factors:
+                        target.build_overviews(factors, Resampling[resampling])
+        copy(tmp, dst, driver="GTiff", copy_src_overviews=True, **options)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def convert(paths, workers=None, **options):
+    """
+    Rewrite GeoTIFFs as Cloud-Optimized GeoTIFFs in a pool of processes
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to the GeoTIFFs
+    workers : int, optional
+        Number of processes. If None, the number of CPUs is used, by default
+        None
+    **options
+        Passed to `to_cog()`
+
+    Returns
+    -------
+    list of str
+        Paths to the COGs, in the order of `paths`
+    """
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown COG option(s): {', '.join(sorted(unknown))}")
+    paths = list(paths)
+    if not paths:
+        return paths
+    failed = []
+    # Conversions are started from download threads, and a forked child could
+    # inherit locks that another thread holds, so workers are spawned instead
+    context = multiprocessing.get_context("spawn")
+    with msg.spin(f"Converting {len(paths)} file(s) to Cloud-Optimized GeoTIFF") as s:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {executor.submit(to_cog, p, **options): p for p in paths}
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    failed.append((futures[future], future.exception()))
+        if not failed:
+            s(1)
+    if failed:
+        msg.err(f"{len(failed)} file(s) could not be converted to COG")
+        path, error = failed[0]
+        raise RuntimeError(f"COG conversion of {path} failed: {error}")
+    return paths
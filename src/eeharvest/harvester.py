@@ -1,17 +1,29 @@
 # import datetime  # for date parsing, but check later if this is needed
 import base64
-import json
+import math
 import os
-import urllib
-from functools import partialmethod
+import re
+import shutil
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
 
 import ee
-import eemont  # trunk-ignore(flake8/F401)
-import geemap.colormaps as cm
-import geemap.foliumap as geemap
-from tqdm.notebook import tqdm
 
-from eeharvest import arc2meter, msg, settings, utils
+from eeharvest import (
+    arc2meter,
+    cache,
+    chips,
+    cog,
+    journal,
+    metrics,
+    msg,
+    planner,
+    ratelimit,
+    settings,
+    utils,
+)
 
 
 def initialise(token_name="EARTHENGINE_TOKEN", auth_mode="gcloud"):
@@ -23,6 +35,8 @@ def initialise(token_name="EARTHENGINE_TOKEN", auth_mode="gcloud"):
 
     Now accepts service tokens as well for use with testing and CI/CD.
     """
+    import geemap.foliumap as geemap
+
     with msg.spin("Initialising Earth Engine...") as s:
         if ee.data._credentials is None:
             try:
@@ -82,6 +96,11 @@ def initialise(token_name="EARTHENGINE_TOKEN", auth_mode="gcloud"):
 initialize = initialise
 
 
+# Earth Engine stops collections from growing past this number of features
+# in a single request
+MAX_FEATURES = 5000
+
+
 class collect:
     """
     A class to manipulate Google Earth Engine objects
@@ -97,7 +116,11 @@ class collect:
     coords: list of str
         GPS coordinates in WGS84 [East, North]. Minimum of one set of
         coordinates should be provided to create a point coordinate. If more
-        than one set of coordinates is provided, a polygon will be created
+        than one set of coordinates is provided, a polygon will be created.
+        Several areas of interest can be given as a list of bounding boxes
+        [xmin, ymin, xmax, ymax] or a GeoJSON FeatureCollection: they share
+        one preprocessed image and are downloaded as one file each, named
+        after the region (or feature) ID
         Start date of image(s) to be collected in YYYY-MM-DD or YYYY format
     date_max : str, optional
         End date of image(s) to be collected in YYYY-MM-DD or YYYY format
@@ -133,6 +156,8 @@ class collect:
         bound=False,
         config=None,
     ):
+        # Timings and request counts of every stage, see `metrics.Metrics`
+        self.metrics = metrics.Metrics()
         # Check if config is a path to a file or a dictionary and read it
         if config is not None:
             try:
@@ -142,14 +167,37 @@ class collect:
                     cfg = config
                 else:
                     raise TypeError("`config` should be a path or a dictionary")
-            settings.validate_schema(config)
+            settings.validate_schema(cfg)
             cfg = settings._add_missing_keys(cfg)
             self.config = cfg
+            # Optionally split the points in infile into compact regions,
+            # which are downloaded separately instead of as one large bbox
+            self.regions = settings._parse_regions(cfg["target_bbox"])
+            if self.regions is not None:
+                cfg["target_bbox"] = settings._regions_bbox(self.regions)
+                msg.info(f"{len(self.regions)} region(s) of interest found")
+            elif cfg["target_bbox"] is None and cfg["cluster_size"] is not None:
+                self.regions = settings._cluster_points(
+                    cfg["infile"],
+                    cfg["colname_lng"],
+                    cfg["colname_lat"],
+                    cfg["cluster_size"],
+                )
+                msg.info(
+                    f"{len(self.regions)} cluster(s) of points found in "
+                    + f"{cfg['infile']}"
+                )
             # validate bounding box from config
             coords = settings._validate_bbox(cfg)
             cfg.update({"target_bbox": coords})
         else:
             self.config = None
+            # Several areas of interest are processed together and
+            # downloaded separately, see `download()`
+            self.regions = settings._parse_regions(coords)
+            if self.regions is not None:
+                coords = settings._regions_bbox(self.regions)
+                msg.info(f"{len(self.regions)} region(s) of interest found")
             # check minimum requirements: if collection, coords, date_min are
             # not None, pass, otherwise print the argument that is missing
             if all(v is not None for v in [collection, coords, date_min]):
@@ -171,6 +219,25 @@ class collect:
             self.bound = bound
         return
 
+    @property
+    def metadata(self):
+        """
+        Image count, band names, image IDs and projection of the preprocessed
+        image
+
+        The values are fetched from Earth Engine in a single request the first
+        time they are needed, and cached until `ee_image` changes.
+        """
+        try:
+            img = self.ee_image
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if getattr(self, "_metadata_source", None) is not img:
+            self._metadata = utils._describe(img)
+            self._metadata_source = img
+        return self._metadata
+
+    @metrics.timed("preprocess")
     def preprocess(
         self,
         mask_clouds=True,
@@ -178,6 +245,8 @@ class collect:
         reduce="median",
         spectral=None,
         clip=True,
+        max_cloud=None,
+        least_cloudy=None,
         **kwargs,
     ):
         """
@@ -212,6 +281,14 @@ class collect:
         clip : bool, optional
             Clip the image. This only affects the interactive map view and will
             not influence the data download, by default True
+        max_cloud : float, optional
+            Drop scenes whose cloud cover metadata, e.g.
+            "CLOUDY_PIXEL_PERCENTAGE" for Sentinel-2 or "CLOUD_COVER" for
+            Landsat, is above this percentage, before any per-pixel
+            processing, by default None
+        least_cloudy : int, optional
+            Keep only this many scenes with the lowest cloud cover, or this
+            many per period in `aggregate()`, by default None
 
         Returns
         -------
@@ -219,6 +296,9 @@ class collect:
             An Earth Engine object which can be further manipulated should the
             user not choose to use other methods in the class.
         """
+        # eemont adds cloud masking and spectral indices to ee objects
+        import eemont  # noqa: F401
+
         msg.title("Running preprocess()")
         # Check if user has provided a config file
         if self.config is None:
@@ -248,23 +328,60 @@ class collect:
             mask_clouds = gee_cfg["mask_clouds"]
             reduce = gee_cfg["reduce"]
             spectral = gee_cfg["spectral"]
+            max_cloud = gee_cfg["max_cloud"]
+            least_cloudy = gee_cfg["least_cloudy"]
         # Make sure collection is a string
         if isinstance(collection, list) and len(collection) == 1:
             collection = collection[0]
         # Let's start ----------------------------------------------------------
         # Define the collection, and filter by aoi
-        aoi = ee.Geometry.Rectangle(coords)
+        if self.regions is None:
+            aoi = ee.Geometry.Rectangle(coords)
+        else:
+            # Only the clusters of points, not the empty space between them
+            aoi = ee.Geometry.MultiPolygon(
+                [utils._bbox_to_polygon(r["bbox"]) for r in self.regions],
+                None,
+                False,
+            )
         img = (
             ee.ImageCollection(collection)
             .filterBounds(aoi)
             .filterDate(str(date_min), str(date_max))
         )
-        # How many images?
-        count = img.size()
-        msg.info(f"Number of image(s) found: {count.getInfo()}")
+        # Drop cloudy scenes on their metadata, before any per-pixel work
+        cloud_property = None
+        if max_cloud is None and least_cloudy is None:
+            # How many images?
+            count = utils._getinfo(img.size())
+            msg.info(f"Number of image(s) found: {count}")
+        else:
+            cloud_property = utils._cloud_property(collection)
+            if cloud_property is None:
+                raise ValueError(
+                    f"No cloud cover metadata is known for {collection}, "
+                    "`max_cloud` and `least_cloudy` cannot be used"
+                )
+            found = img
+            if max_cloud is not None:
+                img = img.filter(ee.Filter.lte(cloud_property, max_cloud))
+            kept = img
+            if least_cloudy is not None:
+                kept = img.sort(cloud_property).limit(least_cloudy)
+            counts = utils._getinfo(
+                ee.Dictionary({"found": found.size(), "kept": kept.size()})
+            )
+            count = counts["kept"]
+            msg.info(f"Number of image(s) found: {counts['found']}")
+            rules = []
+            if max_cloud is not None:
+                rules.append(f"{cloud_property} <= {max_cloud}")
+            if least_cloudy is not None:
+                rules.append(f"the {least_cloudy} least cloudy")
+            msg.info(f"Number of image(s) kept ({', '.join(rules)}): {count}")
 
         # Stop if no images found
-        if count.getInfo() < 1:
+        if count < 1:
             msg.err("Can't process zero images. Processing stopped")
             raise ValueError("No image to process, check your date range")
 
@@ -288,48 +405,103 @@ class collect:
                 return image.clip(aoi)
 
             img = img.map(clip_all)
-        # Reduce image collection
+        # Reduce image collection, keeping the collection for `aggregate()`
+        unreduced = img
+        if least_cloudy is not None:
+            img = img.sort(cloud_property).limit(least_cloudy)
         if reduce is not None:
             img = utils._reduce_by_string(img, reduce)
         # Store attributes
         self.ee_image = img
+        self.ee_collection = unreduced
         self.collection = collection
         self.aoi = aoi
         self.reduce = reduce
         self.spectral = spectral
+        self.cloud_property = cloud_property
+        self.least_cloudy = least_cloudy
 
         msg.success("Preprocessing complete")
         return img
 
-    # def aggregate(self, frequency="month", reduce_by=None, **kwargs):
-    #     """
-    #     Aggregate an Earth Engine Image or ImageCollection by period
-
-    #     Parameters
-    #     ----------
-    #     frequency : str, optional
-    #         aggregation frequency, either by "day". "week" or "month", by
-    #         default "month"
-    #     """
-    #     msg.title("Running aggregate()")
-    #     if reduce_by is None:
-    #         reducer = ee.Reducer.mean()
-    #     # Check if user has provided a config file
-    #     if self.hasconfig is True:
-    #         frequency = self.gee_aggregate["frequency"]
-    #         reduce_by = self.gee_aggregate["reduce_by"]
-    #         cprint(f"Using ee.Reducer.{reduce_by}", "yellow")
-    #     img = self.ee_image
-    #     # Convert to wxee object
-    #     ts = img.wx.to_time_series()
-    #     cprint("\u2139 Initial aggregate", "blue")
-    #     ts.describe()
-    #     out = ts.aggregate_time(frequency=frequency, reducer=reducer)
-    #     with msg.spin("Calculating new temporal aggregate...") as s:
-    #         out.describe()
-    #         s(1)
-    #     self.ee_image = out
+    @metrics.timed("aggregate")
+    def aggregate(self, frequency="month", reducer="median", **kwargs):
+        """
+        Aggregate the preprocessed image collection by period into a single
+        multi-band image
+
+        A composite is made for every week, month or season between
+        `date_min` and `date_max`, and the composites are stacked into one
+        image with band names tagged by period, e.g. "NDVI_median_2022_10".
+        All of this happens server-side, so the whole time series can be
+        downloaded in a single request with `download()`. Periods without
+        images are filled with fully masked bands, so every period is present
+        in the output.
+
+        Parameters
+        ----------
+        frequency : str, optional
+            Aggregation period, one of "week" (counted from `date_min`),
+            "month" or "season" (DJF, MAM, JJA and SON), by default "month"
+        reducer : str, optional
+            Reducer used to make the composite of each period, in the same
+            format as `reduce` in `preprocess()`, by default "median"
+
+        Returns
+        -------
+        ee.Image.Image
+            The stacked composites
+        """
+        msg.title("Running aggregate()")
+        if self.config is not None:
+            cfg = self.config
+            agg_cfg = cfg["target_sources"]["GEE"]["aggregate"] or {}
+            frequency = agg_cfg.get("frequency") or frequency
+            reducer = agg_cfg.get("reducer") or reducer
+            date_min, date_max = cfg["date_min"], cfg["date_max"]
+        else:
+            date_min, date_max = self.date_min, self.date_max
+        try:
+            collection = self.ee_collection
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if date_max is None:
+            raise ValueError("`date_max` is needed to aggregate by period")
+        periods = utils._periods(date_min, date_max, frequency)
+        msg.info(f"Aggregating into {len(periods)} {frequency} composite(s)")
+
+        # Band names of a composite, used to fill periods without images
+        names = utils._reduce_by_string(collection, reducer).bandNames()
+        empty = (
+            ee.Image.constant(ee.List.repeat(0, names.size()))
+            .rename(names)
+            .toFloat()
+            .updateMask(0)
+        )
+        composites = []
+        for label, start, end in periods:
+            subset = collection.filterDate(str(start), str(end))
+            if self.least_cloudy is not None:
+                subset = subset.sort(self.cloud_property).limit(self.least_cloudy)
+            composite = ee.Image(
+                ee.Algorithms.If(
+                    subset.size().gt(0),
+                    utils._reduce_by_string(subset, reducer).toFloat(),
+                    empty,
+                )
+            )
+            composites.append(composite.regexpRename("$", f"_{label}"))
+        img = ee.Image.cat(composites)
+        # Store attributes
+        self.ee_image = img
+        self.reduce = reducer
+        self.frequency = frequency
+        self.periods = [label for label, _, _ in periods]
+
+        msg.success("Aggregation complete")
+        return img
 
+    @metrics.timed("map")
     def map(self, bands=None, minmax=None, palette=None, save_to=None, **kwargs):
         """
         Visualise an Earth Engine Image or ImageCollection on a map
@@ -363,6 +535,9 @@ class collect:
         ValueError
             If the bands are not valid or not present in the image.
         """
+        import geemap.colormaps as cm
+        import geemap.foliumap as geemap
+
         msg.title("Running map()")
         # Check that preprocess() has been called
         try:
@@ -370,7 +545,7 @@ class collect:
         except AttributeError:
             raise AttributeError("No image found, please run `preprocess()`")
         # Validate that at least one band is selected
-        all_bands = get_bandinfo(img)
+        all_bands = self.metadata["bands"]
         if bands is None:
             print("✘ No bands defined - nothing to preview")
             print("\u2139 Please select one or more bands to view image:")
@@ -453,17 +628,38 @@ class collect:
         msg.success("Map generated")
         return Map
 
+    @metrics.timed("download")
     def download(
         self,
         bands=None,
         scale=None,
         outpath=None,
         overwrite=False,
+        tiles=None,
+        workers=4,
+        max_cache_mb=None,
+        on_tile=None,
+        cancel=None,
+        as_cog=None,
         **kwargs,
     ):
         """
         Download an Earth Engine asset to disk and update logtable
 
+        Files are named after a hash of the full Earth Engine computation
+        (including all preprocessing steps), region and scale, so a download
+        that has already been made to `outpath` is found and reused. Downloads
+        are tracked in a manifest in `outpath`, see `cache.DownloadCache`.
+
+        GeoTIFFs keep the type of the bands, with masked pixels set to a nodata
+        value that is recorded in the files: `NODATA` (-9999) for float bands,
+        and a value outside of the range of integer bands (see
+        `utils._pixel_type()`).
+
+        If the points in `infile` were clustered (see `cluster_size` in the
+        config file), every cluster is downloaded as its own file and a
+        "<name>_regions.json" manifest maps each cluster to its file.
+
         Parameters
         ----------
         bands : str or list of str, optional
@@ -480,6 +676,32 @@ class collect:
             folder, by default None
         overwrite : boolean, optional
             Overwrite existing file if it already exists, by default False
+        tiles : int, list of int or "auto", optional
+            Split the download into a grid of tiles that are fetched
+            concurrently and mosaicked into one file, useful for large areas.
+            An integer `n` produces an n x n grid, while a list is read as
+            [columns, rows]. With "auto", the smallest grid that stays under
+            Earth Engine's request limits is used, see `plan()`, by default
+            None
+        workers : int, optional
+            Number of tiles to download at the same time, by default 4
+        max_cache_mb : float, optional
+            Maximum size of all downloads in `outpath` in megabytes. The least
+            recently used downloads are deleted when it is exceeded. If None,
+            downloads are never deleted, by default None
+        on_tile : callable, optional
+            Called as `on_tile(tile, state)` whenever a tile of a tiled
+            download changes state, e.g. to record progress in a
+            `journal.Journal`, by default None
+        cancel : threading.Event, optional
+            Stop the download and remove partial files when the event is set,
+            see `download_async()`, by default None
+        as_cog : bool or dict, optional
+            Convert the downloaded files to compressed Cloud-Optimized
+            GeoTIFFs with overviews, in a pool of processes. A dict sets the
+            options of `cog.to_cog()` and the number of processes ("workers"),
+            e.g. {"compress": "zstd", "workers": 4}. Set with `cog` in the
+            config file, by default None
 
         Returns
         -------
@@ -498,12 +720,17 @@ class collect:
             cfg = self.config
             gee_cfg = cfg["target_sources"]["GEE"]
             collection = gee_cfg["preprocess"]["collection"]
-            date_min = cfg["date_min"]
-            date_max = cfg["date_max"]
-            reduce = gee_cfg["preprocess"]["reduce"]
             coords = cfg["target_bbox"]
             bands = cfg["target_sources"]["GEE"]["download"]["bands"]
             scale = cfg["target_res"]
+            if gee_cfg["download"]["tiles"] is not None:
+                tiles = gee_cfg["download"]["tiles"]
+            if gee_cfg["download"]["workers"] is not None:
+                workers = gee_cfg["download"]["workers"]
+            if gee_cfg["download"]["max_cache_mb"] is not None:
+                max_cache_mb = gee_cfg["download"]["max_cache_mb"]
+            if gee_cfg["download"]["cog"] is not None:
+                as_cog = gee_cfg["download"]["cog"]
             # If outpath is None, check if it's set in the config. If not, use
             # default location of `downloads` folder in working directory
             if outpath is None:
@@ -515,8 +742,6 @@ class collect:
             if outpath is None:
                 outpath = "downloads"
             collection = self.collection
-            date_min = self.date_min
-            date_max = self.date_max
             if scale is None:
                 scale = 100
         bands = [bands] if isinstance(bands, str) else bands
@@ -528,66 +753,1138 @@ class collect:
         aoi = self.aoi
         reduce = self.reduce
         # Check if bands are set
-        all_bands = get_bandinfo(img)
+        all_bands = self.metadata["bands"]
         if bands is None:
             msg.err("No bands defined")
             msg.info("Please select one or more bands to download image:")
             msg.info(str(all_bands))
             return
-        elif reduce is not None:
-            # Match bands if they were modified by "reduce" in preprocess()
-            new_bands = []
-            for item in all_bands:
-                for sub_item in bands:
-                    if item.startswith(sub_item + "_"):
-                        new_bands.append(item)
-                        break
-        else:
-            new_bands = bands
+        # Match bands if they were modified by "reduce" in preprocess()
+        new_bands = utils._match_bands(all_bands, bands, reduce)
         img = img.select(new_bands)
         msg.info(f"Band(s) selected: {new_bands}")
 
         # Convert scale from arsec to meters (if from config file)
-        if self.config is None:
-            pass
-        else:
-            lat_center = (coords[1] + coords[3]) / 2
-            xres_meters, yres_meters = arc2meter.calc_arc2meter(scale, lat_center)
-            msg.info(
-                f"Setting scale to ~{xres_meters:.1f}m, converted from "
-                + f"{scale} arcsec at latitude {lat_center:.2f}"
-            )
-            scale = round(xres_meters, 1)
+        if self.config is not None:
+            scale = self._arcsec_to_metres(scale, coords)
 
-        # Use attributes to generate filename hash
-        new_bands = [new_bands] if isinstance(new_bands, str) else new_bands
         # Make sure collection is a string
         if isinstance(collection, list) and len(collection) == 1:
             collection = collection[0]
-        hash = utils._generate_hash(
-            collection, date_min, date_max, new_bands, reduce, scale
-        )
-        filename = f"ee_{''.join(collection.split('/')[0])}_{hash}.tif"
-
-        # Generate path string
-        final_destination = os.path.join(utils._generate_dir(outpath), filename)
+        # Pick the tiles of each region from the estimated download size
+        layouts = {}
+        if tiles == "auto":
+            coords = coords if self.config is not None else self.coords
+            plan = self._plan(new_bands, scale, coords, collection)
+            msg.info(planner.summary(plan))
+            layouts = {r["id"]: r["tiles"] for r in plan["regions"]}
+            tiles = None
+        utils._generate_dir(outpath)
         msg.info(f"Setting download dir to {outpath}")
-        filenames = download_tif(
-            img, aoi, final_destination, scale, overwrite=overwrite
+        # Image IDs are already cached, no need to ask Earth Engine again
+        ids = [f"{i}.tif" for i in self.metadata["ids"]]
+        max_size = None if max_cache_mb is None else max_cache_mb * 1024**2
+        store = cache.DownloadCache(outpath, max_size=max_size)
+        fetch = partial(
+            self._download_region,
+            img,
+            prefix=f"ee_{''.join(collection.split('/')[0])}",
+            outpath=outpath,
+            scale=scale,
+            overwrite=overwrite,
+            workers=workers,
+            ids=ids,
+            store=store,
+            cancel=cancel,
+            cog_options=_cog_options(as_cog),
+            pixel_type=self._pixel_type(new_bands),
         )
+        if self.regions is None:
+            filename, filenames = fetch(
+                aoi, tiles=layouts.get(None, tiles), on_tile=on_tile
+            )
+            final_destination = os.path.join(outpath, filename)
+        else:
+            filenames, final_destination = self._download_regions(
+                fetch,
+                img,
+                aoi,
+                collection,
+                outpath,
+                scale,
+                workers,
+                on_tile,
+                [layouts.get(r["id"], tiles) for r in self.regions],
+            )
         msg.success("Google Earth Engine download(s) complete")
         # Housekeeping
         self.filenames = filenames
+        self.destination = final_destination
+        self.cache_stats = store.stats()
         return img
 
+    def _download_region(
+        self,
+        img,
+        region,
+        prefix,
+        outpath,
+        scale,
+        overwrite,
+        tiles,
+        workers,
+        ids,
+        store,
+        on_tile=None,
+        cancel=None,
+        cog_options=None,
+        pixel_type=None,
+    ):
+        """
+        Download `img` over one region, unless it is in the download cache,
+        and return the cache file name and the downloaded file name(s)
+        """
+        # Name the file after everything that determines its content
+        key = cache.download_key(img, region, "EPSG:4326", scale)
+        suffix = "" if cog_options is None else "_cog"
+        filename = f"{prefix}_{key}{suffix}.tif"
+        if not overwrite and store.get(filename) is not None:
+            msg.info(f"{filename} found in download cache, skipping download")
+            filenames = filename if isinstance(img, ee.image.Image) else ids
+        else:
+            filenames = download_tif(
+                img,
+                region,
+                os.path.join(outpath, filename),
+                scale,
+                overwrite=overwrite,
+                tiles=tiles,
+                workers=workers,
+                filenames=ids or None,
+                on_tile=on_tile,
+                cancel=cancel,
+                pixel_type=pixel_type,
+            )
+            if cog_options is not None:
+                path = os.path.join(outpath, filename)
+                if isinstance(img, ee.image.Image):
+                    paths = [path]
+                else:
+                    paths = [os.path.join(path, f) for f in filenames]
+                options = dict(cog_options)
+                processes = options.pop("workers", None)
+                utils._check_cancelled(cancel)
+                cog.convert(paths, workers=processes, **options)
+            store.put(filename)
+        return filename, filenames
+
+    def _download_regions(
+        self, fetch, img, aoi, collection, outpath, scale, workers, on_tile, tiles
+    ):
+        """
+        Download every region in `self.regions` concurrently, with the tiles
+        in `tiles` (one entry per region), and write a manifest that maps each
+        region to its file(s)
+
+        Returns the downloaded file names, in region order, and the path to
+        the manifest.
+        """
+
+        def run(region, region_tiles):
+            tile_callback = None
+            if on_tile is not None:
+                # Tile names repeat between regions, so qualify them
+                tile_callback = partial(
+                    lambda id, tile, state: on_tile(f"{id}/{tile}", state),
+                    region["id"],
+                )
+            with msg.prefix(region["id"]):
+                return fetch(
+                    ee.Geometry.Rectangle(region["bbox"]),
+                    prefix=f"{prefix}_{region['id']}",
+                    tiles=region_tiles,
+                    on_tile=tile_callback,
+                )
+
+        prefix = f"ee_{''.join(collection.split('/')[0])}"
+
+        msg.dl(f"Downloading {len(self.regions)} region(s) with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(utils._in_context(run), self.regions, tiles))
+        manifest = [
+            dict(region, filename=filename, filenames=filenames)
+            for region, (filename, filenames) in zip(self.regions, results)
+        ]
+        key = cache.download_key(img, aoi, "EPSG:4326", scale)
+        path = os.path.join(outpath, f"{prefix}_{key}_regions.json")
+        cache._write_json(
+            path, {"collection": collection, "scale": scale, "regions": manifest}
+        )
+        msg.info(f"Region manifest saved to {path}")
+        return [i["filename"] for i in manifest], path
+
+    @metrics.timed("plan")
+    def plan(self, bands=None, scale=None, **kwargs):
+        """
+        Estimate the size of a download before it is made
+
+        The size is estimated locally from the pixel count of each region at
+        `scale` and the number and data type of the selected bands (see
+        `utils._pixel_type()`), and a tile layout is picked for each region
+        so that every request stays under Earth Engine's limits (see
+        `planner`). Nothing is downloaded.
+
+        Parameters
+        ----------
+        bands : str or list of str, optional
+            Bands to download. If None, all bands are included, by default
+            None
+        scale : int, optional
+            Scale in metres, by default 100
+
+        Returns
+        -------
+        dict
+            The plan, with keys "collection", "bands", "scale", "images",
+            "bytes_per_pixel", "bytes" and "regions", a list with the "id",
+            "bbox", "width", "height", "bytes" and "tiles" of each region
+        """
+        msg.title("Running plan()")
+        if self.config is not None:
+            cfg = self.config
+            gee_cfg = cfg["target_sources"]["GEE"]
+            collection = gee_cfg["preprocess"]["collection"]
+            coords = cfg["target_bbox"]
+            bands = gee_cfg["download"]["bands"]
+            scale = self._arcsec_to_metres(cfg["target_res"], coords)
+        else:
+            collection = self.collection
+            coords = self.coords
+            if scale is None:
+                scale = 100
+        if isinstance(collection, list) and len(collection) == 1:
+            collection = collection[0]
+        all_bands = self.metadata["bands"]
+        bands = utils._match_bands(all_bands, bands or all_bands, self.reduce)
+        plan = self._plan(bands, scale, coords, collection)
+        msg.info(planner.summary(plan))
+        for region in plan["regions"]:
+            if region["tiles"] != [1, 1]:
+                name = "Download" if region["id"] is None else region["id"]
+                msg.info(
+                    f"{name} exceeds the Earth Engine request limits and will "
+                    + f"be split into {region['tiles'][0]} x {region['tiles'][1]}"
+                    + " tiles"
+                )
+        self.download_plan = plan
+        return plan
+
+    def _pixel_type(self, bands):
+        """Data type and nodata value of downloads of `bands`"""
+        types = self.metadata["types"]
+        return utils._pixel_type(types[b] for b in bands if b in types)
+
+    def _plan(self, bands, scale, coords, collection):
+        """Plan a download of `bands` at `scale`, see `plan()`"""
+        metadata = self.metadata
+        dtype, _ = self._pixel_type(bands)
+        bytes_per_pixel = utils.DTYPES[dtype][1] * len(bands)
+        if isinstance(self.ee_image, ee.image.Image):
+            images = 1
+        else:
+            images = metadata["count"]
+        if self.regions is None:
+            regions = [{"id": None, "bbox": utils._region_to_bbox(coords)}]
+        else:
+            regions = self.regions
+        estimates = [
+            dict(
+                id=r["id"],
+                bbox=r["bbox"],
+                **planner.estimate(r["bbox"], scale, bytes_per_pixel, images),
+            )
+            for r in regions
+        ]
+        return {
+            "collection": collection,
+            "bands": list(bands),
+            "scale": scale,
+            "images": images,
+            "bytes_per_pixel": bytes_per_pixel,
+            "bytes": sum(r["bytes"] for r in estimates),
+            "regions": estimates,
+        }
+
+    def _arcsec_to_metres(self, scale, coords):
+        """Convert a scale in arcsec to metres at the centre of `coords`"""
+        lat_center = (coords[1] + coords[3]) / 2
+        xres_meters, yres_meters = arc2meter.calc_arc2meter(scale, lat_center)
+        msg.info(
+            f"Setting scale to ~{xres_meters:.1f}m, converted from "
+            + f"{scale} arcsec at latitude {lat_center:.2f}"
+        )
+        return round(xres_meters, 1)
+
+    @metrics.timed("sample")
+    def sample(
+        self,
+        points=None,
+        bands=None,
+        scale=None,
+        outfile=None,
+        outpath=None,
+        colname_lat=None,
+        colname_lng=None,
+        chunk_size=500,
+        workers=4,
+        **kwargs,
+    ):
+        """
+        Extract pixel values at point locations instead of downloading rasters
+
+        Points are sampled server-side with `ee.Image.sampleRegions()` in
+        chunks that are small enough for a single Earth Engine request. The
+        chunks are processed concurrently and their results are written to a
+        csv or Parquet table as they arrive. Points that fall on masked pixels
+        are not included in the table.
+
+        Parameters
+        ----------
+        points : str or pandas.DataFrame, optional
+            A path to a csv file, or a DataFrame, with point coordinates in
+            WGS84. If None, `infile` from the config file is used, by default
+            None
+        bands : str or list of str, optional
+            A string or list of strings representing the bands to sample. If
+            None, the bands from the config file are used, by default None
+        scale : int, optional
+            A number representing the scale in meters at which to sample. If
+            set to None, will pick a default scale value of 100 m, by default
+            None
+        outfile : str, optional
+            Path to the output table. Files ending in ".parquet" are written
+            as Parquet (requires `pyarrow`), anything else as csv. If None, a
+            csv file is named after the image, points and scale and saved in
+            `outpath`, by default None
+        outpath : str, optional
+            Output directory used when `outfile` is None. If None, the
+            `outpath` in the config file or a "downloads" folder is used, by
+            default None
+        colname_lat, colname_lng : str, optional
+            Names of the latitude and longitude columns in `points`. If None,
+            the names in the config file are used, by default None
+        chunk_size : int, optional
+            Number of points sampled in each request, by default 500
+        workers : int, optional
+            Number of requests to run at the same time, by default 4
+
+        Returns
+        -------
+        str
+            Path to the output table, with columns "point_id" (the row number
+            of the point in `points`), longitude, latitude and one column per
+            band
+        """
+        msg.title("Running sample()")
+        try:
+            img = self.ee_image
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if not isinstance(img, ee.image.Image):
+            raise TypeError(
+                "sample() needs a single image, please run `preprocess()` "
+                "with a `reduce` method"
+            )
+        if self.config is not None:
+            cfg = self.config
+            points = cfg["infile"] if points is None else points
+            colname_lat = colname_lat or cfg["colname_lat"]
+            colname_lng = colname_lng or cfg["colname_lng"]
+            if bands is None:
+                bands = cfg["target_sources"]["GEE"]["download"]["bands"]
+            if scale is None:
+                scale = self._arcsec_to_metres(cfg["target_res"], cfg["target_bbox"])
+            outpath = outpath or cfg["outpath"]
+        if any(v is None for v in [points, colname_lat, colname_lng]):
+            raise ValueError(
+                "`points`, `colname_lat` and `colname_lng` are needed to sample"
+            )
+        if scale is None:
+            scale = 100
+        if bands is not None:
+            img = img.select(
+                utils._match_bands(self.metadata["bands"], bands, self.reduce)
+            )
+
+        # Name the table after the image, the points and the scale
+        if outfile is None:
+            if isinstance(points, str):
+                source = [os.path.abspath(points), os.path.getmtime(points)]
+            else:
+                import pandas as pd
+
+                source = [str(pd.util.hash_pandas_object(points).sum())]
+            key = cache.download_key(img, source, "EPSG:4326", scale)
+            collection = self.collection.split("/")[0]
+            outfile = os.path.join(
+                utils._generate_dir(outpath or "downloads"),
+                f"ee_{collection}_{key}_points.csv",
+            )
+
+        def sample_chunk(chunk):
+            features = [
+                ee.Feature(
+                    ee.Geometry.Point([float(x), float(y)]),
+                    {"point_id": int(i), colname_lng: float(x), colname_lat: float(y)},
+                )
+                for i, x, y in zip(
+                    chunk["point_id"], chunk[colname_lng], chunk[colname_lat]
+                )
+            ]
+            sampled = img.sampleRegions(
+                collection=ee.FeatureCollection(features),
+                properties=["point_id", colname_lng, colname_lat],
+                scale=scale,
+                geometries=False,
+            )
+            return [f["properties"] for f in utils._getinfo(sampled)["features"]]
+
+        chunks = settings._iter_points(points, colname_lng, colname_lat, chunk_size)
+        with utils._TableWriter(outfile) as table:
+            with msg.spin(f"Sampling points in chunks of {chunk_size}") as s:
+                for records in utils._imap_unordered(sample_chunk, chunks, workers):
+                    table.write(records)
+                s(1)
+        msg.success(f"{table.rows} point(s) sampled and saved to {outfile}")
+        self.filenames = os.path.basename(outfile)
+        self.destination = outfile
+        return outfile
+
+    @metrics.timed("chips")
+    def chips(
+        self,
+        points=None,
+        size=None,
+        bands=None,
+        scale=None,
+        outfile=None,
+        outpath=None,
+        colname_lat=None,
+        colname_lng=None,
+        shard_size=1024,
+        workers=8,
+        **kwargs,
+    ):
+        """
+        Extract a square chip of pixels around every point, e.g. to build a
+        machine learning dataset
+
+        Chips are centred on the points and `buffer` metres wide on each side
+        of them, or `size` pixels wide. If `bound` is False, pixels outside
+        the circular buffer are set to NaN. Every chip is fetched with one
+        `ee.data.computePixels()` request, many at a time, and all chips are
+        written to one dataset with their point IDs, see `eeharvest.chips`.
+
+        Parameters
+        ----------
+        points : str or pandas.DataFrame, optional
+            A path to a csv or Parquet file, or a DataFrame, with point
+            coordinates in WGS84. If None, `infile` from the config file is
+            used, by default None
+        size : int, optional
+            Width and height of the chips in pixels. If None, it is
+            calculated from `buffer` and `scale`, by default None
+        bands : str or list of str, optional
+            Bands to extract. If None, the bands from the config file, or all
+            bands, are used, by default None
+        scale : int, optional
+            Pixel size in metres. If None, `target_res` from the config file
+            or 100 m is used, by default None
+        outfile : str, optional
+            Path to the output. Paths ending in ".zarr" are written as a Zarr
+            store (requires `zarr`), ".h5" or ".hdf5" as an HDF5 file
+            (requires `h5py`), and anything else as a folder of NPZ shards.
+            If None, an NPZ folder is named after the image, points and chip
+            size and saved in `outpath`, by default None
+        outpath : str, optional
+            Output directory used when `outfile` is None, by default None
+        colname_lat, colname_lng : str, optional
+            Names of the latitude and longitude columns in `points`. If None,
+            the names in the config file are used, by default None
+        shard_size : int, optional
+            Number of chips per NPZ shard, or per chunk of the point arrays
+            in Zarr and HDF5 outputs, by default 1024
+        workers : int, optional
+            Number of chips to fetch at the same time, by default 8
+
+        Returns
+        -------
+        str
+            Path to the output
+        """
+        msg.title("Running chips()")
+        try:
+            img = self.ee_image
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if not isinstance(img, ee.image.Image):
+            raise TypeError(
+                "chips() needs a single image, please run `preprocess()` "
+                "with a `reduce` method"
+            )
+        if self.config is not None:
+            cfg = self.config
+            gee_cfg = cfg["target_sources"]["GEE"]
+            buffer, bound = (
+                gee_cfg["preprocess"]["buffer"],
+                gee_cfg["preprocess"]["bound"],
+            )
+            points = cfg["infile"] if points is None else points
+            colname_lat = colname_lat or cfg["colname_lat"]
+            colname_lng = colname_lng or cfg["colname_lng"]
+            if bands is None:
+                bands = gee_cfg["download"]["bands"]
+            if scale is None:
+                scale = self._arcsec_to_metres(cfg["target_res"], cfg["target_bbox"])
+            outpath = outpath or cfg["outpath"]
+        else:
+            buffer, bound = self.buffer, self.bound
+        if any(v is None for v in [points, colname_lat, colname_lng]):
+            raise ValueError(
+                "`points`, `colname_lat` and `colname_lng` are needed to extract chips"
+            )
+        if scale is None:
+            scale = 100
+        if size is None:
+            if not buffer:
+                raise ValueError("Either `size` or `buffer` is needed to extract chips")
+            size = max(1, math.ceil(2 * buffer / scale))
+        all_bands = self.metadata["bands"]
+        bands = utils._match_bands(all_bands, bands or all_bands, self.reduce)
+        image = chips.prepare(img.select(bands))
+        outside = None if bound else ~chips.circle(size)
+        msg.info(f"Extracting chips of {size} x {size} pixels at {scale}m")
+
+        # Name the output after the image, the points and the chips
+        if outfile is None:
+            if isinstance(points, str):
+                source = [os.path.abspath(points), os.path.getmtime(points)]
+            else:
+                import pandas as pd
+
+                source = [str(pd.util.hash_pandas_object(points).sum())]
+            key = cache.download_key(
+                image, source + [size, bool(bound)], "EPSG:4326", scale
+            )
+            collection = self.collection.split("/")[0]
+            outfile = os.path.join(
+                utils._generate_dir(outpath or "downloads"),
+                f"ee_{collection}_{key}_chips",
+            )
+
+        def point_grids():
+            for chunk in settings._iter_points(points, colname_lng, colname_lat):
+                lng, lat = chunk[colname_lng], chunk[colname_lat]
+                grids = chips.grids(lng, lat, size, scale)
+                yield from zip(chunk["point_id"], lng, lat, grids)
+
+        def fetch_chip(item):
+            point_id, lng, lat, grid = item
+            chip = chips.fetch(image, grid, bands)
+            metrics.record_bytes(chip.nbytes)
+            if outside is not None:
+                chip[:, outside] = float("nan")
+            return point_id, lng, lat, chip
+
+        with chips.ChipWriter(outfile, bands, size, shard_size) as writer:
+            with msg.spin(f"Fetching chips with {workers} workers") as s:
+                for result in utils._imap_unordered(fetch_chip, point_grids(), workers):
+                    writer.write(*result)
+                s(1)
+        msg.success(f"{writer.rows} chip(s) saved to {outfile}")
+        self.filenames = os.path.basename(outfile)
+        self.destination = outfile
+        return outfile
+
+    @metrics.timed("zonal_stats")
+    def zonal_stats(
+        self,
+        features=None,
+        reducers=("mean",),
+        bands=None,
+        scale=None,
+        outfile=None,
+        outpath=None,
+        batch_size=100,
+        workers=4,
+        tile_scale=1,
+        **kwargs,
+    ):
+        """
+        Summarise the image over polygons instead of downloading rasters
+
+        Statistics are calculated server-side with `ee.Image.reduceRegions()`
+        in batches of features that are small enough for a single Earth
+        Engine request. The batches are processed concurrently and their
+        results are written to a csv or Parquet table as they arrive, so no
+        pixels are transferred.
+
+        Parameters
+        ----------
+        features : str, dict or ee.FeatureCollection, optional
+            A GeoJSON FeatureCollection, as a dict or a path to a file, or an
+            Earth Engine FeatureCollection. If None, the regions given as
+            `coords` or `target_bbox` are used: the geometries of GeoJSON
+            features, or else the bounding boxes, by default None
+        reducers : list of str, optional
+            Statistics to calculate, e.g. "mean", "median", "min", "max",
+            "stdDev", "count" or percentiles such as "p10" and "p90". Reducers
+            with several outputs, such as "minMax", give one column per output,
+            by default ("mean",)
+        bands : str or list of str, optional
+            Bands to summarise. If None, the bands from the config file, or
+            all bands, are used, by default None
+        scale : int, optional
+            Scale in metres at which pixels are summarised. If None,
+            `target_res` from the config file or 100 m is used, by default
+            None
+        outfile : str, optional
+            Path to the table. Paths ending in ".parquet" or ".pq" are written
+            as Parquet (requires `pyarrow`), anything else as csv. If None, a
+            csv file is named after the image, features and reducers and
+            saved in `outpath`, by default None
+        outpath : str, optional
+            Output directory used when `outfile` is None, by default None
+        batch_size : int, optional
+            Number of features per request, by default 100
+        workers : int, optional
+            Number of batches to process at the same time, by default 4
+        tile_scale : int, optional
+            `tileScale` of `reduceRegions()`. Larger values use less memory
+            on Earth Engine's side for large polygons, by default 1
+
+        Returns
+        -------
+        str
+            Path to the table, with a "zone_id" column (the feature ID, see
+            `settings._read_features()`, or "system:index" for Earth Engine
+            collections) and one float "<band>_<output>" column per statistic
+        """
+        msg.title("Running zonal_stats()")
+        try:
+            img = self.ee_image
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if not isinstance(img, ee.image.Image):
+            raise TypeError(
+                "zonal_stats() needs a single image, please run `preprocess()` "
+                "with a `reduce` method"
+            )
+        if self.config is not None:
+            cfg = self.config
+            if bands is None:
+                bands = cfg["target_sources"]["GEE"]["download"]["bands"]
+            if scale is None:
+                scale = self._arcsec_to_metres(cfg["target_res"], cfg["target_bbox"])
+            outpath = outpath or cfg["outpath"]
+        if scale is None:
+            scale = 100
+        all_bands = self.metadata["bands"]
+        bands = [bands] if isinstance(bands, str) else bands
+        bands = utils._match_bands(all_bands, bands or all_bands, self.reduce)
+        img = img.select(bands)
+        reducers = [reducers] if isinstance(reducers, str) else list(reducers)
+        reducer, outputs = utils._zonal_reducer(reducers)
+        columns = utils._zonal_columns(bands, outputs)
+
+        # Batches of features, made client-side from GeoJSON or paged
+        # server-side from an Earth Engine collection
+        if features is None:
+            if self.regions is None:
+                raise ValueError("`features` is needed, or several regions as `coords`")
+            # Features keep their own geometry, clusters and bboxes are boxes
+            zones = [(r["id"], utils._region_geometry(r)) for r in self.regions]
+            source = [[id, geometry] for id, geometry in zones]
+            zones = [(id, ee.Geometry(geometry)) for id, geometry in zones]
+        elif isinstance(features, ee.FeatureCollection):
+            zones = None
+            source = [features.serialize()]
+        else:
+            zones = [
+                (id, ee.Geometry(geometry))
+                for id, geometry in settings._read_features(features)
+            ]
+            if isinstance(features, str):
+                source = [os.path.abspath(features), os.path.getmtime(features)]
+            else:
+                source = [features]
+        if zones is None:
+            count = utils._getinfo(features.size())
+            labelled = features.map(lambda f: f.set("zone_id", f.get("system:index")))
+            batches = (
+                ee.FeatureCollection(labelled.toList(batch_size, offset))
+                for offset in range(0, count, batch_size)
+            )
+        else:
+            count = len(zones)
+            batches = (
+                ee.FeatureCollection(
+                    [
+                        ee.Feature(geometry, {"zone_id": id})
+                        for id, geometry in zones[start : start + batch_size]
+                    ]
+                )
+                for start in range(0, count, batch_size)
+            )
+
+        # Name the table after the image, the features and the statistics
+        if outfile is None:
+            key = cache.download_key(
+                img, source + reducers + [tile_scale], "EPSG:4326", scale
+            )
+            collection = self.collection.split("/")[0]
+            outfile = os.path.join(
+                utils._generate_dir(outpath or "downloads"),
+                f"ee_{collection}_{key}_zonal.csv",
+            )
+
+        def reduce_batch(batch):
+            reduced = img.reduceRegions(
+                collection=batch, reducer=reducer, scale=scale, tileScale=tile_scale
+            )
+            # Geometries are not needed in the table, leave them on the server
+            reduced = reduced.select(["zone_id"] + list(columns), None, False)
+            records = []
+            for feature in utils._getinfo(reduced)["features"]:
+                properties = feature["properties"]
+                record = {"zone_id": properties.get("zone_id")}
+                for name, column in columns.items():
+                    record[column] = properties.get(name)
+                records.append(record)
+            return records
+
+        # Statistics are numbers, even if a whole batch of zones has no data
+        dtypes = {column: "float64" for column in columns.values()}
+        with utils._TableWriter(outfile, dtypes=dtypes) as table:
+            message = f"Summarising {count} feature(s) in batches of {batch_size}"
+            with msg.spin(message) as s:
+                for records in utils._imap_unordered(reduce_batch, batches, workers):
+                    table.write(records)
+                s(1)
+        msg.success(f"{table.rows} feature(s) summarised and saved to {outfile}")
+        self.filenames = os.path.basename(outfile)
+        self.destination = outfile
+        return outfile
+
+    @metrics.timed("timeseries")
+    def timeseries(
+        self,
+        points=None,
+        bands=None,
+        scale=None,
+        outfile=None,
+        outpath=None,
+        colname_lat=None,
+        colname_lng=None,
+        chunk_size=None,
+        workers=4,
+        **kwargs,
+    ):
+        """
+        Extract the time series of every image in the collection at point
+        locations, instead of a composite
+
+        The preprocessed collection, before any reduction, is sampled
+        server-side with `ee.Image.sampleRegions()` mapped over its images, in
+        chunks of points small enough for a single Earth Engine request.
+        Chunks are processed concurrently and written to a long-format table
+        as they arrive, so memory use does not grow with the number of
+        points. Pixels that are masked in an image are not included.
+
+        Parameters
+        ----------
+        points : str or pandas.DataFrame, optional
+            A path to a csv or Parquet file, or a DataFrame, with point
+            coordinates in WGS84. If None, `infile` from the config file is
+            used, by default None
+        bands : str or list of str, optional
+            Bands to extract. If None, the bands from the config file, or all
+            bands, are used, by default None
+        scale : int, optional
+            Scale in metres at which to sample. If None, `target_res` from the
+            config file or 100 m is used, by default None
+        outfile : str, optional
+            Path to the table. Paths ending in ".parquet" or ".pq" are written
+            as Parquet (requires `pyarrow`), anything else as csv. If None, a
+            csv file is named after the collection, points and scale and
+            saved in `outpath`, by default None
+        outpath : str, optional
+            Output directory used when `outfile` is None, by default None
+        colname_lat, colname_lng : str, optional
+            Names of the latitude and longitude columns in `points`. If None,
+            the names in the config file are used, by default None
+        chunk_size : int, optional
+            Number of points per request. If None, as many as fit in one
+            request for the number of images, by default None
+        workers : int, optional
+            Number of chunks to process at the same time, by default 4
+
+        Returns
+        -------
+        str
+            Path to the table, with columns "point_id" (the row number of the
+            point in `points`), "date", "band" and "value"
+        """
+        msg.title("Running timeseries()")
+        try:
+            collection = self.ee_collection
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if self.least_cloudy is not None:
+            collection = collection.sort(self.cloud_property).limit(self.least_cloudy)
+        if self.config is not None:
+            cfg = self.config
+            points = cfg["infile"] if points is None else points
+            colname_lat = colname_lat or cfg["colname_lat"]
+            colname_lng = colname_lng or cfg["colname_lng"]
+            if bands is None:
+                bands = cfg["target_sources"]["GEE"]["download"]["bands"]
+            if scale is None:
+                scale = self._arcsec_to_metres(cfg["target_res"], cfg["target_bbox"])
+            outpath = outpath or cfg["outpath"]
+        if any(v is None for v in [points, colname_lat, colname_lng]):
+            raise ValueError(
+                "`points`, `colname_lat` and `colname_lng` are needed to "
+                "extract time series"
+            )
+        if scale is None:
+            scale = 100
+        info = utils._getinfo(
+            ee.Dictionary(
+                {
+                    "times": collection.aggregate_array("system:time_start"),
+                    "bands": collection.first().bandNames(),
+                }
+            )
+        )
+        count = len(info["times"])
+        # Long collections are sampled in date ranges of at most MAX_FEATURES
+        # images, so that even a single point fits in one request
+        windows = utils._time_windows(info["times"], MAX_FEATURES)
+        per_window = max((n for _, _, n in windows), default=1)
+        bands = [bands] if isinstance(bands, str) else bands
+        bands = list(bands or info["bands"])
+        missing = [b for b in bands if b not in info["bands"]]
+        if missing:
+            raise ValueError(f"Band(s) not found in the collection: {missing}")
+        collection = collection.select(bands)
+        if chunk_size is None:
+            # Each point yields one feature per image
+            chunk_size = max(1, MAX_FEATURES // per_window)
+        msg.info(
+            f"Extracting {len(bands)} band(s) from {count} image(s) in "
+            + f"{len(windows)} date range(s) at {scale}m in chunks of "
+            + f"{chunk_size} point(s)"
+        )
+
+        # Name the table after the collection, the points and the scale
+        if outfile is None:
+            if isinstance(points, str):
+                source = [os.path.abspath(points), os.path.getmtime(points)]
+            else:
+                import pandas as pd
+
+                source = [str(pd.util.hash_pandas_object(points).sum())]
+            key = cache.download_key(collection, source, "EPSG:4326", scale)
+            name = self.collection.split("/")[0]
+            outfile = os.path.join(
+                utils._generate_dir(outpath or "downloads"),
+                f"ee_{name}_{key}_timeseries.csv",
+            )
+
+        def sample_chunk(item):
+            chunk, (start, end, _) = item
+            features = ee.FeatureCollection(
+                [
+                    ee.Feature(
+                        ee.Geometry.Point([float(x), float(y)]), {"point_id": int(i)}
+                    )
+                    for i, x, y in zip(
+                        chunk["point_id"], chunk[colname_lng], chunk[colname_lat]
+                    )
+                ]
+            )
+
+            def sample_image(image):
+                date = image.date().format("YYYY-MM-dd")
+                return image.sampleRegions(
+                    collection=features,
+                    properties=["point_id"],
+                    scale=scale,
+                    geometries=False,
+                ).map(lambda f: f.set("date", date))
+
+            images = collection.filterDate(start, end)
+            sampled = images.map(sample_image).flatten()
+            return utils._to_long(utils._getinfo(sampled)["features"], bands)
+
+        chunks = (
+            (chunk, window)
+            for chunk in settings._iter_points(
+                points, colname_lng, colname_lat, chunk_size
+            )
+            for window in windows
+        )
+        with utils._TableWriter(outfile, dtypes={"value": "float64"}) as table:
+            with msg.spin(f"Sampling time series with {workers} workers") as s:
+                for records in utils._imap_unordered(sample_chunk, chunks, workers):
+                    table.write(records)
+                s(1)
+        msg.success(f"{table.rows} value(s) extracted and saved to {outfile}")
+        self.filenames = os.path.basename(outfile)
+        self.destination = outfile
+        return outfile
+
+    @metrics.timed("to_numpy")
+    def to_numpy(
+        self,
+        bands=None,
+        scale=None,
+        region=None,
+        tiles=None,
+        workers=4,
+        cancel=None,
+        **kwargs,
+    ):
+        """
+        Fetch the image straight into a NumPy array, without writing a
+        GeoTIFF to disk
+
+        Pixels are fetched with `ee.data.computePixels()` on a grid in
+        EPSG:4326. Regions that are too large for one request are split into
+        tiles (see `planner`), which are fetched concurrently and copied into
+        one array.
+
+        Parameters
+        ----------
+        bands : str or list of str, optional
+            Bands to fetch. If None, the bands from the config file, or all
+            bands, are used, by default None
+        scale : int, optional
+            Pixel size in metres. If None, `target_res` from the config file
+            or 100 m is used, by default None
+        region : list of float, optional
+            Bounding box [xmin, ymin, xmax, ymax] to fetch. If None, the
+            bounding box of the area of interest is used, by default None
+        tiles : int or list of int, optional
+            Number of tiles, or a [columns, rows] layout. If None, the
+            smallest layout that fits Earth Engine's request limits is used,
+            by default None
+        workers : int, optional
+            Number of tiles to fetch at the same time, by default 4
+        cancel : threading.Event, optional
+            Stop fetching tiles once the event is set, by default None
+
+        Returns
+        -------
+        tuple of (numpy.ndarray, dict)
+            A float32 array of bands x rows x columns, NaN where the image is
+            masked, and its metadata with keys "bands", "crs", "transform"
+            (an `affine.Affine`), "bbox" and "scale"
+        """
+        import numpy as np
+        from affine import Affine
+
+        msg.title("Running to_numpy()")
+        try:
+            img = self.ee_image
+        except AttributeError:
+            raise AttributeError("No image found, please run `preprocess()`")
+        if not isinstance(img, ee.image.Image):
+            raise TypeError(
+                "to_numpy() needs a single image, please run `preprocess()` "
+                "with a `reduce` method"
+            )
+        if self.config is not None:
+            cfg = self.config
+            coords = cfg["target_bbox"]
+            if bands is None:
+                bands = cfg["target_sources"]["GEE"]["download"]["bands"]
+            if scale is None:
+                scale = self._arcsec_to_metres(cfg["target_res"], coords)
+        else:
+            coords = self.coords
+        if scale is None:
+            scale = 100
+        bbox = list(region) if region is not None else utils._region_to_bbox(coords)
+        all_bands = self.metadata["bands"]
+        bands = [bands] if isinstance(bands, str) else bands
+        bands = utils._match_bands(all_bands, bands or all_bands, self.reduce)
+        image = chips.prepare(img.select(bands))
+
+        width, height = planner.grid_size(bbox, scale)
+        if tiles is None:
+            # Pixels are fetched as float32, with one extra band for the mask
+            tiles = planner.tile_layout(width, height, 4 * (len(bands) + 1))
+        elif isinstance(tiles, int):
+            tiles = [tiles, 1]
+        step = scale / planner.METRES_PER_DEGREE
+        transform = Affine(step, 0, bbox[0], 0, -step, bbox[3])
+        windows = planner.windows(width, height, tiles)
+        msg.info(
+            f"Fetching {len(bands)} band(s) of {width} x {height} pixels at "
+            + f"{scale}m in {len(windows)} request(s)"
+        )
+
+        def fetch_tile(window):
+            utils._check_cancelled(cancel)
+            col, row, w, h = window
+            x0, y0 = transform * (col, row)
+            grid = {
+                "dimensions": {"width": w, "height": h},
+                "affineTransform": {
+                    "scaleX": step,
+                    "shearX": 0,
+                    "translateX": x0,
+                    "shearY": 0,
+                    "scaleY": -step,
+                    "translateY": y0,
+                },
+                "crsCode": "EPSG:4326",
+            }
+            pixels = chips.fetch(image, grid, bands)
+            metrics.record_bytes(pixels.nbytes)
+            return window, pixels
+
+        array = np.full((len(bands), height, width), np.nan, dtype="float32")
+        with msg.spin(f"Fetching pixels with {workers} workers") as s:
+            for (col, row, w, h), pixels in utils._imap_unordered(
+                fetch_tile, windows, workers
+            ):
+                array[:, row : row + h, col : col + w] = pixels
+            s(1)
+        xmax, ymin = transform * (width, height)
+        meta = {
+            "bands": bands,
+            "crs": "EPSG:4326",
+            "transform": transform,
+            "bbox": [bbox[0], ymin, xmax, bbox[3]],
+            "scale": scale,
+        }
+        msg.success(f"Fetched an array of shape {array.shape}")
+        return array, meta
+
+    def to_xarray(self, *args, **kwargs):
+        """
+        Fetch the image straight into an `xarray.DataArray`, see `to_numpy()`
+
+        The array has the dimensions "band", "y" and "x", with the band names
+        and the coordinates of the pixel centres, and the metadata from
+        `to_numpy()` in its `attrs`. Requires `xarray`.
+
+        Returns
+        -------
+        xarray.DataArray
+        """
+        try:
+            import xarray as xr
+        except ImportError:
+            raise ImportError("to_xarray() requires `xarray`")
+        import numpy as np
+
+        array, meta = self.to_numpy(*args, **kwargs)
+        transform = meta["transform"]
+        _, height, width = array.shape
+        x = transform.c + transform.a * (np.arange(width) + 0.5)
+        y = transform.f + transform.e * (np.arange(height) + 0.5)
+        return xr.DataArray(
+            array,
+            dims=("band", "y", "x"),
+            coords={"band": meta["bands"], "y": y, "x": x},
+            attrs={
+                "crs": meta["crs"],
+                "transform": tuple(transform)[:6],
+                "bbox": meta["bbox"],
+                "scale": meta["scale"],
+            },
+        )
+
+    async def preprocess_async(self, *args, **kwargs):
+        """
+        Asynchronous version of `preprocess()`
+
+        Runs `preprocess()` in a worker thread, so that the Earth Engine
+        requests it makes do not block the event loop. Accepts the same
+        arguments as `preprocess()`.
+        """
+        return await utils._run_async(self.preprocess, *args, **kwargs)
+
+    async def download_async(self, *args, **kwargs):
+        """
+        Asynchronous version of `download()`
+
+        Runs `download()` in a worker thread, so that the event loop is not
+        blocked. Accepts the same arguments as `download()`. The number of
+        blocking calls in flight across all async functions is bounded by
+        EEHARVEST_ASYNC_WORKERS (16 by default).
+
+        If the task is cancelled, the download stops once the request that is
+        in progress returns, and partial files are removed before the
+        cancellation is propagated. Tiles that were completed are kept, so a
+        new download of the same image reuses them.
+        """
+        return await utils._run_async(self.download, *args, cancellable=True, **kwargs)
+
 
 class AutoResult:
-    def __init__(self, obj, filenames):
+    def __init__(self, obj, filenames, errors=None, plans=None, metrics=None):
         self.obj = obj
         self.filenames = [filenames] if isinstance(filenames, str) else filenames
+        # Exceptions raised by individual profiles, keyed by profile number
+        self.errors = {} if errors is None else errors
+        # Download plans (see `collect.plan()`), keyed by profile number
+        self.plans = {} if plans is None else plans
+        # Combined metrics of all profiles, see `metrics.Metrics`
+        self.metrics = metrics
 
 
-def auto(config, outpath=None):
+def auto(config, outpath=None, workers=1, resume=False, cancel=None, plan_only=False):
+    """
+    Preprocess and download all collections defined in a config file
+
+    The state of every configuration profile is recorded in a journal file
+    in the download folder (see `journal.Journal`), so that an interrupted
+    run can be resumed.
+
+    Parameters
+    ----------
+    config : str
+        Path string to a YAML configuration file
+    outpath : str, optional
+        A string representing the path to the output directory. If set to None,
+        the `outpath` in the config file is used, by default None
+    workers : int, optional
+        Number of configuration profiles (one per collection) to process at
+        the same time, by default 1
+    resume : bool, optional
+        Skip the profiles that the journal of a previous run records as done,
+        and reuse the tiles it has already downloaded, by default False
+    cancel : threading.Event, optional
+        Stop the run and remove partial files when the event is set, see
+        `auto_async()`, by default None
+    plan_only : bool, optional
+        Preprocess every profile and print its download plan (see
+        `collect.plan()`) without downloading anything. The plans are stored
+        in `AutoResult.plans`, by default False
+
+    Returns
+    -------
+    AutoResult
+        The `collect` object(s) and downloaded filename(s), in profile order.
+        When multiple collections are processed, a profile that fails does not
+        stop the others and its exception is stored in `AutoResult.errors`
+    """
+    started = time.perf_counter()
     cfg = settings.read(config)
     multi = settings._detect_multi_collection(cfg)
     if multi:
@@ -601,7 +1898,7 @@ def auto(config, outpath=None):
         # Validate bands
         bands = cfg["target_sources"]["GEE"]["download"]["bands"]
         if all(isinstance(i, list) for i in bands):
-            for (n, i, j) in zip(range(1, num_configs + 1), collections, bands):
+            for n, i, j in zip(range(1, num_configs + 1), collections, bands):
                 print(f"  Profile {n} will process '{i}' and download bands {j}")
         else:
             msg.err(
@@ -615,7 +1912,7 @@ def auto(config, outpath=None):
 
         # Generate new configs
         new_configs = []
-        for (n, i, j) in zip(range(1, num_configs + 1), collections, bands):
+        for n, i, j in zip(range(1, num_configs + 1), collections, bands):
             new_config = utils._update_nested(
                 cfg, {"target_sources": {"GEE": {"preprocess": {"collection": i}}}}
             )
@@ -623,66 +1920,205 @@ def auto(config, outpath=None):
                 new_config, {"target_sources": {"GEE": {"download": {"bands": j}}}}
             )
             new_configs.append(new_config)
+    else:
+        new_configs = [cfg]
+    profiles = list(zip(range(1, len(new_configs) + 1), new_configs))
+    if plan_only:
+        return _plan_profiles(profiles, started)
+
+    # Record the plan in the journal, keeping profiles that are already done
+    job = journal.Journal(outpath or cfg.get("outpath") or "downloads")
+    keys = {n: journal.profile_key(i) for (n, i) in profiles}
+    for n, i in profiles:
+        if not resume:
+            job.update(keys[n], "planned", number=n, tiles={})
+        elif not job.completed(keys[n]):
+            job.update(keys[n], "planned", number=n)
+
+    # Process and download
+    def run_profile(n, profile):
+        key = keys[n]
+        img = None
+        try:
+            img = collect(config=profile)
+            entry = job.completed(key) if resume else None
+            if entry is not None:
+                msg.info(f"Profile {n} was completed by a previous run, skipping")
+                img.filenames = entry["filenames"]
+                img.destination = entry["destination"]
+                return img, None
+            utils._check_cancelled(cancel)
+            job.update(key, "downloading")
+            img.preprocess()
+            if (img.config["target_sources"]["GEE"]["aggregate"] or {}).get(
+                "frequency"
+            ):
+                img.aggregate()
+            utils._check_cancelled(cancel)
+            mode = img.config["target_sources"]["GEE"]["download"]["mode"]
+            if mode == "sample":
+                img.sample(outpath=outpath)
+            elif mode == "chips":
+                img.chips(outpath=outpath)
+            elif mode == "timeseries":
+                img.timeseries(outpath=outpath)
+            else:
+                img.download(
+                    outpath=outpath, on_tile=partial(job.tile, key), cancel=cancel
+                )
+            job.update(
+                key,
+                "done",
+                filenames=getattr(img, "filenames", None),
+                destination=getattr(img, "destination", None),
+            )
+            return img, None
+        except CancelledError:
+            # Not a failure: the profile can be resumed later
+            job.update(key, "planned")
+            raise
+        except Exception as e:
+            job.update(key, "failed", error=f"{type(e).__name__}: {e}")
+            if not multi:
+                raise
+            msg.err(f"Profile {n} failed: {type(e).__name__}: {e}")
+            return img, e
+
+    def run_tagged(n, profile):
+        with msg.prefix(f"Profile {n}"):
+            return run_profile(n, profile)
 
-        # Process and download
-        img_list = []
-        for (n, i) in zip(range(1, num_configs + 1), new_configs):
+    if not multi:
+        # download single collection
+        img, _ = run_profile(*profiles[0])
+        filenames = img.filenames
+        run_metrics = _combine_metrics([img], time.perf_counter() - started)
+        return AutoResult(img, filenames, metrics=run_metrics)
+    if workers > 1:
+        msg.info(f"Processing {num_configs} profiles with {workers} workers")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(
+                executor.map(utils._in_context(lambda p: run_tagged(*p)), profiles)
+            )
+    else:
+        results = []
+        for n, i in profiles:
             msg.info(
                 f"-------------------- Downloading Profile {n} --------------------"
             )
-            img = collect(config=i)
+            results.append(run_profile(n, i))
+    img_list = [img for img, _ in results]
+    filenames = [getattr(img, "filenames", None) for img in img_list]
+    errors = {n: e for (n, _), (_, e) in zip(profiles, results) if e is not None}
+    if errors:
+        msg.warn(
+            f"{len(errors)} of {num_configs} profile(s) failed: "
+            + ", ".join(str(n) for n in errors)
+        )
+    run_metrics = _combine_metrics(img_list, time.perf_counter() - started)
+    return AutoResult(img_list, filenames, errors, metrics=run_metrics)
+
+
+def _combine_metrics(objs, seconds):
+    """Combine the metrics of the `collect` objects of an `auto()` run"""
+    combined = metrics.Metrics()
+    for obj in objs:
+        if obj is not None:
+            combined.merge(obj.metrics)
+    combined.add_stage("auto", seconds)
+    return combined
+
+
+def _plan_profiles(profiles, started):
+    """Preprocess each profile and plan its download, see `auto(plan_only=True)`"""
+    img_list, plans = [], {}
+    for n, profile in profiles:
+        with msg.prefix(f"Profile {n}"):
+            img = collect(config=profile)
             img.preprocess()
-            img.download(outpath=outpath)
-            img_list.append(img)
-        filenames = [i.filenames for i in img_list]
-        return AutoResult(img_list, filenames)
-    else:
-        # download single collection
-        img = collect(config=config)
-        img.preprocess()
-        if outpath is None:
-            img.download()
-        else:
-            img.download(outpath=outpath)
-        filenames = img.filenames
-        return AutoResult(img, filenames)
+            if (img.config["target_sources"]["GEE"]["aggregate"] or {}).get(
+                "frequency"
+            ):
+                img.aggregate()
+            plans[n] = img.plan()
+        img_list.append(img)
+    total = sum(p["bytes"] for p in plans.values())
+    msg.success(
+        f"Planned {len(plans)} profile(s), ~{utils.convert_size(total)} in total"
+    )
+    run_metrics = _combine_metrics(img_list, time.perf_counter() - started)
+    if len(img_list) == 1:
+        return AutoResult(img_list[0], [], plans=plans, metrics=run_metrics)
+    return AutoResult(img_list, [], plans=plans, metrics=run_metrics)
+
+
+async def auto_async(config, outpath=None, workers=1, resume=False, plan_only=False):
+    """
+    Asynchronous version of `auto()`
+
+    Runs `auto()` in a worker thread, so that many harvests can be in flight
+    from a single event loop, e.g. with `asyncio.gather()`. Cancelling the
+    task removes partial files and leaves the profiles that were not done as
+    "planned" in the journal, so the run can be resumed with `resume=True`.
+    See `auto()` for the arguments.
+    """
+    return await utils._run_async(
+        auto, config, outpath, workers, resume, plan_only=plan_only, cancellable=True
+    )
 
 
 def get_indices() -> dict:
     """
     Returns a dictionary of available indices from Awesome Spectral Indices
+
+    The dictionary is cached on disk and in memory, see `eeharvest.cache`.
     """
-    with urllib.request.urlopen(
+    indices = cache.fetch_json(
         # trunk-ignore(flake8/E501)
-        "https://raw.githubusercontent.com/awesome-spectral-indices/awesome-spectral-indices/main/output/spectral-indices-dict.json"
-    ) as url:
-        try:
-            indices = json.loads(url.read().decode())
-        except Exception as e:
-            print(e)
+        "https://raw.githubusercontent.com/awesome-spectral-indices/awesome-spectral-indices/main/output/spectral-indices-dict.json",
+        name="spectral-indices-dict",
+        snapshot="spectral-indices-dict.json",
+    )
     return indices["SpectralIndices"]
 
 
 def ee_stac():
     """
     Returns full list of STAC IDs from the Earth Engine Data Catalog
+
+    The catalog is cached on disk and in memory, see `eeharvest.cache`.
     """
-    try:
+    data = cache.fetch_json(
         # trunk-ignore(flake8/E501)
-        stac_url = "https://raw.githubusercontent.com/samapriya/Earth-Engine-Datasets-List/master/gee_catalog.json"
-        datasets = []
-        with urllib.request.urlopen(stac_url) as url:
-            data = json.loads(url.read().decode())
-            datasets = [item["id"] for item in data]
-        return datasets
-    except Exception as e:
-        raise Exception(e)
-
-
-def download_tif(image, region, path, scale, crs="EPSG:4326", overwrite=False):
+        "https://raw.githubusercontent.com/samapriya/Earth-Engine-Datasets-List/master/gee_catalog.json",
+        name="gee_catalog",
+        snapshot="gee_catalog.json",
+    )
+    return [item["id"] for item in data]
+
+
+def download_tif(
+    image,
+    region,
+    path,
+    scale,
+    crs="EPSG:4326",
+    overwrite=False,
+    tiles=None,
+    workers=4,
+    filenames=None,
+    on_tile=None,
+    cancel=None,
+    verbose=True,
+    pixel_type=None,
+):
     """
     Download image to local folder as GeoTIFF
 
+    Images are fetched with `getDownloadURL()` and streamed to disk, with
+    masked pixels set to a nodata value (see `_fetch_tif()`). Nothing global
+    is changed, so downloads can run in many threads of one process at once.
+
     Parameters
     ----------
     image : obj
@@ -695,6 +2131,31 @@ def download_tif(image, region, path, scale, crs="EPSG:4326", overwrite=False):
         Scale in metres to define the image resolution
     crs : str, optional
         Coordinate reference system, by default "EPSG:4326"
+    overwrite : bool, optional
+        Overwrite existing file if it already exists, by default False
+    tiles : int or list of int, optional
+        Split the region into a grid of tiles which are downloaded
+        concurrently and mosaicked into a single file. An integer `n` produces
+        an n x n grid, while a list is read as [columns, rows]. Only used for
+        ee.Image objects, by default None
+    workers : int, optional
+        Number of tiles to download at the same time, by default 4
+    filenames : list of str, optional
+        File names of the images in an ee.ImageCollection, if already known.
+        Fetched from Earth Engine if None, by default None
+    on_tile : callable, optional
+        Called as `on_tile(tile, state)` whenever a tile changes state, where
+        state is one of "planned", "downloading", "done" or "failed", by
+        default None
+    cancel : threading.Event, optional
+        Stop downloading when the event is set. Partial files are removed and
+        `concurrent.futures.CancelledError` is raised, by default None
+    verbose : bool, optional
+        Print progress messages for this download, by default True
+    pixel_type : tuple, optional
+        Data type and nodata value of the files, see `utils._pixel_type()`.
+        Taken from the band types of the (first) image if None, by default
+        None
     """
     if isinstance(image, ee.image.Image):
         filename = os.path.basename(path)
@@ -702,37 +2163,378 @@ def download_tif(image, region, path, scale, crs="EPSG:4326", overwrite=False):
         if os.path.exists(path) and overwrite is False:
             msg.warn(f"{filename} already exists, skipping download")
             return filename
-        # Otherwise download image
-        with utils._suppress():
-            # hide tqdm if disable=True
-            tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
-            # Get filename from path
-
-            with msg.spin(f"Downloading {filename}") as s:
-                geemap.download_ee_image(
-                    image=image,
-                    region=region,
-                    filename=path,
-                    crs="EPSG:4326",
-                    scale=scale,
-                )
+        if pixel_type is None:
+            pixel_type = _image_pixel_type(image)
+        # Large regions can be split into tiles that are fetched concurrently
+        if tiles is not None and tiles not in (1, [1, 1]):
+            _download_tiles(
+                image,
+                region,
+                path,
+                scale,
+                crs,
+                tiles,
+                workers,
+                overwrite,
+                on_tile,
+                cancel,
+                verbose,
+                pixel_type,
+            )
+            return filename
+        spinner = msg.spin(f"Downloading {filename}") if verbose else _no_spin()
+        try:
+            with spinner as s:
+                _fetch_tif(image, region, path, scale, crs, cancel, pixel_type)
                 s(1)
-        # final_size = convert_size(os.path.getsize(path))
-        # cprint(f"✔ File saved as {path} [final size {final_size}]", "green")
+        except ee.EEException as e:
+            tiles = _tiles_for_error(e)
+            if tiles is None:
+                raise
+            # Too large for one request, split it into tiles instead
+            if verbose:
+                msg.warn(f"{filename} is too large for one request, tiling")
+            _download_tiles(
+                image,
+                region,
+                path,
+                scale,
+                crs,
+                tiles,
+                workers,
+                overwrite,
+                on_tile,
+                cancel,
+                verbose,
+                pixel_type,
+            )
         return filename
     else:
-        file_list = utils._imageID_to_tifID(image)
-        geemap.download_ee_image_collection(
-            collection=image,
-            out_dir=path,
-            region=region,
-            crs="EPSG:4326",
-            scale=scale,
+        if filenames is None:
+            file_list = utils._imageID_to_tifID(image)
+        else:
+            file_list = filenames
+        _download_images(
+            image,
+            file_list,
+            region,
+            path,
+            scale,
+            crs,
+            overwrite,
+            workers,
+            cancel,
+            verbose,
+            pixel_type,
         )
         # cprint(f"✔ Files saved to {path}", "green")
     return file_list
 
 
+def _download_images(
+    collection,
+    file_list,
+    region,
+    path,
+    scale,
+    crs,
+    overwrite,
+    workers,
+    cancel=None,
+    verbose=True,
+    pixel_type=None,
+):
+    """
+    Download every image of a collection as its own file in the `path`
+    folder, `workers` images at a time
+
+    Images whose file already exists are skipped unless `overwrite` is True,
+    so an interrupted download only fetches the images that are missing.
+    All images are written with the `pixel_type` of the first image.
+    """
+    utils._generate_dir(path)
+    todo = [
+        f for f in file_list if overwrite or not os.path.exists(os.path.join(path, f))
+    ]
+    if verbose and len(todo) < len(file_list):
+        msg.info(
+            f"{len(file_list) - len(todo)} of {len(file_list)} image(s) found "
+            + f"in {path}, skipping"
+        )
+    if not todo:
+        return file_list
+    if pixel_type is None:
+        pixel_type = _image_pixel_type(collection)
+
+    def fetch(filename):
+        index = os.path.splitext(filename)[0]
+        image = ee.Image(collection.filter(ee.Filter.eq("system:index", index)).first())
+        target = os.path.join(path, filename)
+        try:
+            return _fetch_tif(image, region, target, scale, crs, cancel, pixel_type)
+        except ee.EEException as e:
+            tiles = _tiles_for_error(e)
+            if tiles is None:
+                raise
+        # Too large for one request, split it into tiles instead
+        _download_tiles(
+            image,
+            region,
+            target,
+            scale,
+            crs,
+            tiles,
+            workers,
+            overwrite,
+            cancel=cancel,
+            verbose=False,
+            pixel_type=pixel_type,
+        )
+        return os.path.getsize(target)
+
+    if verbose:
+        msg.dl(f"Downloading {len(todo)} image(s) with {workers} workers")
+    failed = []
+    sizes = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(utils._in_context(fetch), f) for f in todo]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                failed.append(future.exception())
+            else:
+                sizes.append(future.result())
+    utils._check_cancelled(cancel)
+    seconds = max(time.perf_counter() - start, 1e-9)
+    if verbose:
+        msg.info(
+            f"{len(sizes)} image(s), {utils.convert_size(sum(sizes))}, in "
+            + f"{seconds:.1f}s: {len(sizes) / seconds:.2f} image(s)/s, "
+            + f"{utils.convert_size(sum(sizes) / seconds)}/s"
+        )
+    if failed:
+        msg.err(f"{len(failed)} image(s) could not be downloaded")
+        raise RuntimeError(
+            f"Download of {len(failed)} image(s) to {path} failed, run again "
+            + f"to fetch the missing images. First error: {failed[0]}"
+        )
+    return file_list
+
+
+# Value of masked pixels in downloaded float GeoTIFFs
+NODATA = utils.NODATA
+
+
+def _image_pixel_type(image):
+    """
+    Data type and nodata value of downloads of an ee.Image, or of the first
+    image of an ee.ImageCollection, see `utils._pixel_type()`
+    """
+    if not isinstance(image, ee.image.Image):
+        image = ee.Image(image.first())
+    return utils._pixel_type(utils._getinfo(image.bandTypes()).values())
+
+
+def _fetch_tif(
+    image, region, path, scale, crs="EPSG:4326", cancel=None, pixel_type=None
+):
+    """
+    Download an image as a GeoTIFF with a single `getDownloadURL()` request
+    and return the size of the file
+
+    All bands are cast to the data type of `pixel_type`, a (dtype, nodata)
+    tuple from `utils._pixel_type()` that is taken from the band types of the
+    image if None, and masked pixels are set to its nodata value, which is
+    recorded in the file. The response is streamed to a temporary file that
+    is moved into place once it is complete.
+    """
+    import urllib.error
+    import urllib.request
+
+    import rasterio
+
+    utils._check_cancelled(cancel)
+    if pixel_type is None:
+        pixel_type = _image_pixel_type(image)
+    dtype, nodata = pixel_type
+    image = getattr(image, utils.DTYPES[dtype][0])()
+    image = image.unmask(nodata, sameFootprint=False)
+    params = {"region": region, "scale": scale, "crs": crs, "format": "GEO_TIFF"}
+    url = ratelimit.call(image.getDownloadURL, params)
+
+    def open_url():
+        try:
+            return urllib.request.urlopen(url, timeout=300)
+        except urllib.error.HTTPError as e:
+            # Earth Engine explains rejected requests in the body
+            if e.code in ratelimit.RETRYABLE_STATUS:
+                raise
+            raise ee.EEException(e.read().decode(errors="replace")) from e
+
+    part = os.path.splitext(path)[0] + ".part.tif"
+    try:
+        with ratelimit.call(open_url) as response, open(part, "wb") as f:
+            while True:
+                utils._check_cancelled(cancel)
+                block = response.read(1024**2)
+                if not block:
+                    break
+                f.write(block)
+        with rasterio.open(part, "r+") as dataset:
+            dataset.nodata = nodata
+        os.replace(part, path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    size = os.path.getsize(path)
+    metrics.record_bytes(size)
+    return size
+
+
+def _tiles_for_error(error):
+    """
+    Return an [n, n] tile layout small enough for a request that failed with
+    `error` because it was too large, or None if it failed for another reason
+    """
+    text = str(error)
+    if "request size" not in text.lower():
+        return None
+    found = re.search(r"\((\d+) bytes\)", text)
+    if found is None:
+        return [2, 2]
+    n = math.ceil(math.sqrt(int(found.group(1)) / planner.MAX_REQUEST_BYTES))
+    return [max(n, 2)] * 2
+
+
+@contextmanager
+def _no_spin():
+    """A stand-in for `msg.spin()` that prints nothing"""
+    yield lambda *args, **kwargs: None
+
+
+def _download_tiles(
+    image,
+    region,
+    path,
+    scale,
+    crs,
+    tiles,
+    workers,
+    overwrite,
+    on_tile=None,
+    cancel=None,
+    verbose=True,
+    pixel_type=None,
+):
+    """
+    Download an image as a grid of tiles and mosaic them into `path`
+
+    Tiles are kept in a "<name>_tiles" folder next to `path` until the mosaic
+    has been written, so that an interrupted download only needs to fetch the
+    tiles that are missing. Tiles that are done are also kept when the
+    download is cancelled through `cancel`.
+    """
+    filename = os.path.basename(path)
+    tile_dir = os.path.splitext(path)[0] + "_tiles"
+    if overwrite and os.path.exists(tile_dir):
+        shutil.rmtree(tile_dir)
+    utils._generate_dir(tile_dir)
+    bboxes = utils._split_bbox(utils._region_to_bbox(region), tiles)
+    tile_paths = [
+        os.path.join(tile_dir, f"tile_{n:04d}.tif") for n in range(len(bboxes))
+    ]
+    todo = [(p, b) for p, b in zip(tile_paths, bboxes) if not os.path.exists(p)]
+    if on_tile is None:
+
+        def on_tile(tile, state):
+            pass
+
+    if todo and pixel_type is None:
+        # Every tile has the same type, ask Earth Engine once
+        pixel_type = _image_pixel_type(image)
+    pending = [p for p, _ in todo]
+    for p in tile_paths:
+        on_tile(os.path.basename(p), "planned" if p in pending else "done")
+    if verbose and len(todo) < len(tile_paths):
+        msg.info(
+            f"{len(tile_paths) - len(todo)} of {len(tile_paths)} tile(s) of "
+            + f"{filename} found on disk, reusing"
+        )
+
+    def fetch(tile_path, bbox):
+        # Tiles are written to a temporary file first (see `_fetch_tif()`), so
+        # a failed download does not leave a partial tile that would be reused
+        tile = os.path.basename(tile_path)
+        utils._check_cancelled(cancel)
+        on_tile(tile, "downloading")
+        try:
+            _fetch_tif(
+                image,
+                ee.Geometry.Rectangle(bbox),
+                tile_path,
+                scale,
+                crs,
+                cancel,
+                pixel_type,
+            )
+        except CancelledError:
+            on_tile(tile, "planned")
+            raise
+        except Exception:
+            on_tile(tile, "failed")
+            raise
+        on_tile(tile, "done")
+        return tile_path
+
+    if verbose:
+        msg.dl(f"Downloading {len(todo)} of {len(tile_paths)} tile(s) for {filename}")
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(utils._in_context(fetch), p, b) for p, b in todo]
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                failed.append(future.exception())
+    utils._check_cancelled(cancel)
+    if failed:
+        msg.err(f"{len(failed)} tile(s) of {filename} could not be downloaded")
+        raise RuntimeError(
+            f"Tiled download of {filename} failed, run again to fetch the "
+            + f"missing tiles. First error: {failed[0]}"
+        )
+    message = f"Mosaicking {len(tile_paths)} tiles into {filename}"
+    with msg.spin(message) if verbose else _no_spin() as s:
+        part = os.path.splitext(path)[0] + ".part.tif"
+        utils._mosaic(tile_paths, part)
+        os.replace(part, path)
+        s(1)
+    shutil.rmtree(tile_dir)
+    return path
+
+
+def _cog_options(value):
+    """
+    Options of `cog.convert()` from the `as_cog` argument of `download()`, or
+    None if the files are not converted
+    """
+    if value is None or value is False:
+        return None
+    if value is True:
+        return {}
+    return dict(value)
+
+
+async def download_tif_async(image, region, path, scale, **kwargs):
+    """
+    Asynchronous version of `download_tif()`
+
+    Cancelling the task removes partial files, see `collect.download_async()`.
+    """
+    return await utils._run_async(
+        download_tif, image, region, path, scale, cancellable=True, **kwargs
+    )
+
+
 def validate_collection(collection):
     """
     Checks whether collection ID string is a STAC in the GEE catalog
@@ -787,7 +2589,7 @@ def get_bandinfo(image):
     Return list of available bands in image
     """
     try:
-        bands = image.bandNames().getInfo()
+        bands = utils._getinfo(image.bandNames())
     except AttributeError:
-        bands = image.first().bandNames().getInfo()
+        bands = utils._getinfo(image.first().bandNames())
     return bands
@@ -0,0 +1,85 @@
+"""
+A job journal that makes `auto()` runs resumable.
+
+The journal is a JSON file in the download folder which records the state of
+every configuration profile, and of every tile of a tiled download, as one
+of "planned", "downloading", "done" or "failed". A run started with
+`auto(config, resume=True)` reads the journal and skips the profiles that
+are done, while tiled downloads reuse the tiles that are done.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from eeharvest import cache
+
+JOURNAL_NAME = ".eeharvest_journal.json"
+STATES = ("planned", "downloading", "done", "failed")
+
+
+def profile_key(profile):
+    """Return a key that identifies a configuration profile by its content"""
+    content = json.dumps(profile, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()[:16]
+
+
+class Journal:
+    """
+    The state of the profiles and tiles of an `auto()` run
+
+    Attributes
+    ----------
+    path : str
+        Path to the journal file
+    profiles : dict
+        Journal entries keyed by profile key (see `profile_key()`)
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.path = os.path.join(directory, JOURNAL_NAME)
+        self._lock = threading.Lock()
+        try:
+            self.profiles = cache._read_json(self.path)["profiles"]
+        except (FileNotFoundError, ValueError, KeyError):
+            self.profiles = {}
+
+    def _save(self):
+        cache._write_json(self.path, {"profiles": self.profiles})
+
+    def update(self, key, state=None, **fields):
+        """Set the state and any other fields of a profile"""
+        if state is not None and state not in STATES:
+            raise ValueError(f"Unknown journal state '{state}'")
+        with self._lock:
+            entry = self.profiles.setdefault(key, {"state": "planned", "tiles": {}})
+            if state is not None:
+                entry["state"] = state
+            entry.update(fields, updated=time.time())
+            self._save()
+
+    def tile(self, key, tile, state):
+        """Set the state of a tile of a profile"""
+        if state not in STATES:
+            raise ValueError(f"Unknown journal state '{state}'")
+        with self._lock:
+            entry = self.profiles.setdefault(key, {"state": "planned", "tiles": {}})
+            entry["tiles"][tile] = state
+            self._save()
+
+    def completed(self, key):
+        """
+        Return the journal entry of a profile if it is done and its output is
+        still on disk, otherwise None
+        """
+        with self._lock:
+            entry = self.profiles.get(key)
+        if entry is None or entry["state"] != "done":
+            return None
+        if not os.path.exists(entry.get("destination") or ""):
+            return None
+        return entry
@@ -0,0 +1,249 @@
+"""
+Timing and Earth Engine round-trip instrumentation.
+
+Every `collect` object has a `Metrics` object, `collect.metrics`, which
+records the wall time of each stage (`preprocess()`, `download()`, ...), the
+number and latency of `getInfo()` calls, the bytes downloaded and the hits
+and misses of the download cache. `auto()` combines the metrics of all its
+profiles in `AutoResult.metrics`.
+
+Metrics are recorded into the object that is active in the current context
+(see `activate()`), which carries over to the worker threads eeharvest
+starts. They can be written as JSON or in the Prometheus text format to
+track throughput over time.
+"""
+
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_active = contextvars.ContextVar("eeharvest_metrics", default=None)
+
+
+def current():
+    """Return the active Metrics object, or None"""
+    return _active.get()
+
+
+class Metrics:
+    """
+    Counters and timings of an eeharvest run
+
+    Attributes
+    ----------
+    stages : dict
+        Number of calls ("calls") and total wall time in seconds ("seconds")
+        of each stage, keyed by stage name
+    getinfo_calls : int
+        Number of `getInfo()` requests to Earth Engine
+    getinfo_seconds : float
+        Total time spent waiting for `getInfo()` requests
+    getinfo_max_seconds : float
+        Latency of the slowest `getInfo()` request
+    bytes_downloaded : int
+        Size of the files downloaded from Earth Engine
+    cache_hits : int
+        Downloads found in the download cache
+    cache_misses : int
+        Downloads not found in the download cache
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.getinfo_calls = 0
+        self.getinfo_seconds = 0.0
+        self.getinfo_max_seconds = 0.0
+        self.bytes_downloaded = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @contextmanager
+    def activate(self):
+        """Record into this object within the `with` block"""
+        token = _active.set(self)
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    @contextmanager
+    def stage(self, name):
+        """Record the wall time of the `with` block as stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+            entry["calls"] += 1
+            entry["seconds"] += seconds
+
+    def add_getinfo(self, seconds):
+        with self._lock:
+            self.getinfo_calls += 1
+            self.getinfo_seconds += seconds
+            self.getinfo_max_seconds = max(self.getinfo_max_seconds, seconds)
+
+    def add_bytes(self, size):
+        with self._lock:
+            self.bytes_downloaded += size
+
+    def add_cache(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def merge(self, other):
+        """Add the counts and timings of another Metrics object to this one"""
+        snapshot = other.as_dict()
+        with self._lock:
+            for name, entry in snapshot["stages"].items():
+                own = self.stages.setdefault(name, {"calls": 0, "seconds": 0.0})
+                own["calls"] += entry["calls"]
+                own["seconds"] += entry["seconds"]
+            self.getinfo_calls += snapshot["getinfo_calls"]
+            self.getinfo_seconds += snapshot["getinfo_seconds"]
+            self.getinfo_max_seconds = max(
+                self.getinfo_max_seconds, snapshot["getinfo_max_seconds"]
+            )
+            self.bytes_downloaded += snapshot["bytes_downloaded"]
+            self.cache_hits += snapshot["cache_hits"]
+            self.cache_misses += snapshot["cache_misses"]
+        return self
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "stages": {k: dict(v) for k, v in self.stages.items()},
+                "getinfo_calls": self.getinfo_calls,
+                "getinfo_seconds": self.getinfo_seconds,
+                "getinfo_max_seconds": self.getinfo_max_seconds,
+                "bytes_downloaded": self.bytes_downloaded,
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+            }
+
+    def to_json(self, path):
+        """Write the metrics to a JSON file"""
+        _write_atomic(path, json.dumps(self.as_dict(), indent=2))
+        return path
+
+    def to_prometheus(self, path, labels=None):
+        """
+        Write the metrics to a file in the Prometheus text format, e.g. for
+        the textfile collector of the node exporter
+
+        Parameters
+        ----------
+        path : str
+            Path to the file
+        labels : dict, optional
+            Labels added to every sample, e.g. {"job": "landsat"}, by default
+            None
+        """
+        data = self.as_dict()
+        extra = "".join(f',{k}="{v}"' for k, v in (labels or {}).items())
+        plain = "{" + extra[1:] + "}" if extra else ""
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append(f"# HELP eeharvest_{name} {description}")
+            lines.append(f"# TYPE eeharvest_{name} {kind}")
+            for label, value in samples:
+                lines.append(f"eeharvest_{name}{label} {value}")
+
+        stages = sorted(data["stages"].items())
+        metric(
+            "stage_seconds_total",
+            "counter",
+            "Wall time spent in each stage",
+            [(f'{{stage="{k}"{extra}}}', v["seconds"]) for k, v in stages],
+        )
+        metric(
+            "stage_calls_total",
+            "counter",
+            "Number of times each stage was run",
+            [(f'{{stage="{k}"{extra}}}', v["calls"]) for k, v in stages],
+        )
+        for name, kind, description, key in [
+            ("getinfo_calls_total", "counter", "getInfo requests", "getinfo_calls"),
+            (
+                "getinfo_seconds_total",
+                "counter",
+                "Time spent waiting for getInfo requests",
+                "getinfo_seconds",
+            ),
+            (
+                "getinfo_max_seconds",
+                "gauge",
+                "Latency of the slowest getInfo request",
+                "getinfo_max_seconds",
+            ),
+            (
+                "downloaded_bytes_total",
+                "counter",
+                "Bytes downloaded from Earth Engine",
+                "bytes_downloaded",
+            ),
+            ("cache_hits_total", "counter", "Download cache hits", "cache_hits"),
+            ("cache_misses_total", "counter", "Download cache misses", "cache_misses"),
+        ]:
+            metric(name, kind, description, [(plain, data[key])])
+        _write_atomic(path, "\n".join(lines) + "\n")
+        return path
+
+
+def _write_atomic(path, text):
+    """Write text to a temporary file and move it into place atomically"""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def timed(name):
+    """
+    Decorate a `collect` method to record its wall time as stage `name` and
+    make `self.metrics` the active Metrics object while it runs
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.activate(), self.metrics.stage(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_getinfo(seconds):
+    """Record a `getInfo()` call in the active Metrics object, if any"""
+    active = _active.get()
+    if active is not None:
+        active.add_getinfo(seconds)
+
+
+def record_bytes(size):
+    """Record downloaded bytes in the active Metrics object, if any"""
+    active = _active.get()
+    if active is not None:
+        active.add_bytes(size)
+
+
+def record_cache(hit):
+    """Record a download cache hit or miss in the active Metrics object, if any"""
+    active = _active.get()
+    if active is not None:
+        active.add_cache(hit)
@@ -1,4 +1,8 @@
+import contextvars
 import logging
+import threading
+import time
+from contextlib import contextmanager
 
 from alive_progress import alive_bar, config_handler
 from termcolor import colored, cprint
@@ -14,15 +18,41 @@ config_handler.set_global(
     elapsed="{elapsed}",
 )
 
+# Messages can be printed from several threads at once, e.g. when `auto()` runs
+# profiles concurrently. A lock keeps lines intact, and a per-thread tag
+# tells the reader which profile a message belongs to.
+_lock = threading.Lock()
+_tag = contextvars.ContextVar("tag", default=None)
+
+
+@contextmanager
+def prefix(tag):
+    """Prefix messages printed from the current thread with a tag"""
+    token = _tag.set(tag)
+    try:
+        yield
+    finally:
+        # Restore the outer tag, if prefixes are nested
+        _tag.reset(token)
+
+
+def _print(message, **kwargs):
+    """Prints a message, with the thread tag if set"""
+    tag = _tag.get()
+    if tag is not None:
+        message = f"[{tag}] " + message
+    with _lock:
+        cprint(message, **kwargs)
+
 
 def info(message, icon=True, log=False):
     """Prints a custom info message"""
     if log:
         logging.info(message)
     if icon:
-        cprint("\u2139 " + message.lstrip(), color="magenta")
+        _print("\u2139 " + message.lstrip(), color="magenta")
     else:
-        cprint("  " + message.lstrip(), color="magenta")
+        _print("  " + message.lstrip(), color="magenta")
 
 
 def title(message, log=False):
@@ -30,39 +60,52 @@ def title(message, log=False):
     if log:
         logging.info(message)
         # u25cc?
-    cprint(message + " -----", color="cyan", attrs=["bold"])
+    _print(message + " -----", color="cyan", attrs=["bold"])
 
 
 def dl(message, log=False):
     """Prints a custom downloading message"""
     if log:
         logging.info(message)
-    cprint("\u29e9 " + message, color="magenta")
+    _print("\u29e9 " + message, color="magenta")
 
 
 def warn(message, log=False):
     """Prints a custom warning message"""
     if log:
         logging.warning(message)
-    cprint("\u2691 " + message, color="red")
+    _print("\u2691 " + message, color="red")
 
 
 def err(message, log=False):
     """Prints a custom error message"""
     if log:
         logging.error(message)
-    cprint("\u2716 " + message.lstrip(), color="red", attrs=["bold"])
+    _print("\u2716 " + message.lstrip(), color="red", attrs=["bold"])
 
 
 def success(message, log=False):
     """Prints a custom success message"""
     if log:
         logging.info(message)
-    cprint("\u2714 " + message, color="green")
+    _print("\u2714 " + message, color="green")
 
 
 def spin(message=None, colour="magenta", events=1, log=False):
     """Spin animation as a progress inidicator"""
     if log:
         logging.info(message)
+    # Animations from several threads would overwrite each other, so tagged
+    # threads only print a line once the task is done
+    if _tag.get() is not None:
+        return _quiet_spin(message, colour)
     return alive_bar(events, title=colored("\u2299 " + message, color=colour))
+
+
+@contextmanager
+def _quiet_spin(message, colour):
+    """A stand-in for `spin()` that prints the elapsed time when done"""
+    start = time.perf_counter()
+    yield lambda *args, **kwargs: None
+    elapsed = time.perf_counter() - start
+    _print(f"\u2299 {message} done in {elapsed:.1f}s", color=colour)
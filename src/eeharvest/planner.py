@@ -0,0 +1,129 @@
+"""
+Pre-flight size estimation and tiling of downloads.
+
+Earth Engine rejects a download request when its uncompressed size or its
+pixel grid is too large, but only once the request has been made. The
+planner estimates the size of a download locally, from the pixel count of
+the region at the requested scale and the number of bands, and picks
+the smallest grid of tiles (see `download(tiles=...)`) whose tiles all stay
+under the per-request limits.
+"""
+
+import math
+
+from eeharvest import utils
+
+# Per-request limits of Earth Engine's getDownloadURL and computePixels
+MAX_REQUEST_BYTES = 32 * 1024**2
+MAX_GRID_DIMENSION = 10000
+
+# Size of a band of unknown type, as a float32 download (see
+# `utils._pixel_type()`)
+BYTES_PER_BAND = 4
+
+# Length of one degree at the equator in metres, which Earth Engine uses to
+# convert a scale in metres to degrees for EPSG:4326 downloads
+METRES_PER_DEGREE = 111319.49
+
+
+def grid_size(bbox, scale):
+    """
+    Width and height in pixels of a bounding box [xmin, ymin, xmax, ymax]
+    in EPSG:4326 at `scale` metres
+    """
+    xmin, ymin, xmax, ymax = bbox
+    width = math.ceil((xmax - xmin) * METRES_PER_DEGREE / scale)
+    height = math.ceil((ymax - ymin) * METRES_PER_DEGREE / scale)
+    return max(width, 1), max(height, 1)
+
+
+def tile_layout(
+    width,
+    height,
+    bytes_per_pixel,
+    max_bytes=MAX_REQUEST_BYTES,
+    max_dimension=MAX_GRID_DIMENSION,
+):
+    """
+    Return the smallest [columns, rows] grid that splits an image of `width`
+    by `height` pixels into tiles that fit the request limits
+
+    Tiles are kept close to square by splitting along the longer side of the
+    tiles first.
+    """
+    ncol = math.ceil(width / max_dimension)
+    nrow = math.ceil(height / max_dimension)
+    while True:
+        tile_width = math.ceil(width / ncol)
+        tile_height = math.ceil(height / nrow)
+        if tile_width * tile_height * bytes_per_pixel <= max_bytes:
+            return [ncol, nrow]
+        if tile_width >= tile_height:
+            ncol += 1
+        else:
+            nrow += 1
+
+
+def windows(width, height, tiles):
+    """
+    Split a grid of `width` by `height` pixels into a [columns, rows] layout
+    of tiles
+
+    Returns
+    -------
+    list of tuple
+        The (column offset, row offset, width, height) of each tile in
+        pixels, row by row from the top left
+    """
+    ncol, nrow = tiles
+    tile_width = math.ceil(width / ncol)
+    tile_height = math.ceil(height / nrow)
+    return [
+        (col, row, min(tile_width, width - col), min(tile_height, height - row))
+        for row in range(0, height, tile_height)
+        for col in range(0, width, tile_width)
+    ]
+
+
+def estimate(bbox, scale, bytes_per_pixel, images=1, **limits):
+    """
+    Estimate the size of a download and plan its tiles
+
+    Parameters
+    ----------
+    bbox : list of float
+        Bounding box [xmin, ymin, xmax, ymax] in EPSG:4326
+    scale : float
+        Scale in metres
+    bytes_per_pixel : int
+        Size of one pixel of all bands, e.g. `BYTES_PER_BAND` times the number
+        of bands for float32 downloads
+    images : int, optional
+        Number of images downloaded over the region, by default 1
+    **limits
+        `max_bytes` and `max_dimension` passed to `tile_layout()`
+
+    Returns
+    -------
+    dict
+        Keys "width" and "height" (pixels), "bytes" (uncompressed size of all
+        images) and "tiles" ([columns, rows] of each image)
+    """
+    width, height = grid_size(bbox, scale)
+    return {
+        "width": width,
+        "height": height,
+        "bytes": width * height * bytes_per_pixel * images,
+        "tiles": tile_layout(width, height, bytes_per_pixel, **limits),
+    }
+
+
+def summary(plan):
+    """Describe a plan from `collect.plan()` in one line"""
+    tiles = [r["tiles"][0] * r["tiles"][1] for r in plan["regions"]]
+    return (
+        f"{plan['collection']}: {len(plan['bands'])} band(s) x "
+        + f"{plan['images']} image(s) over {len(plan['regions'])} region(s) "
+        + f"at {plan['scale']}m, ~{utils.convert_size(plan['bytes'])} "
+        + f"uncompressed in {sum(tiles)} request(s)"
+    )
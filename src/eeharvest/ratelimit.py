@@ -0,0 +1,171 @@
+"""
+Rate limiting and retries of Earth Engine requests.
+
+Earth Engine rejects requests with 429 "Too many requests" or "Too many
+concurrent aggregations" errors when a user sends too many at once. All
+remote calls eeharvest makes go through `call()`, which:
+
+1. takes a token from a token bucket that is shared by every process on the
+   host, through a state file in the cache directory (see
+   `cache.cache_dir()`) that is locked while it is updated
+2. retries errors that are worth retrying with jittered exponential backoff,
+   and empties the shared bucket so that the other processes slow down too
+
+The bucket refills at `EEHARVEST_RATE_LIMIT` requests per second (default
+10, 0 disables the limit) up to `EEHARVEST_RATE_BURST` tokens (default 20),
+and a call is attempted at most `EEHARVEST_MAX_RETRIES` + 1 times (default
+5 retries).
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+from eeharvest import cache, msg
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # Not available on Windows, where the bucket is only shared by threads
+    fcntl = None
+
+# Parts of error messages of requests that may succeed if they are retried:
+# quota and concurrency limits, and transport errors that Earth Engine only
+# passes on as text. Messages such as "Computation timed out." are left out,
+# as the same computation would fail again.
+RETRYABLE = (
+    "too many concurrent aggregations",
+    "too many requests",
+    "quota exceeded",
+    "rate limit",
+    "service unavailable",
+    "connection reset",
+    "connection aborted",
+)
+
+# HTTP status codes of requests that may succeed if they are retried
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return float(os.environ.get(name, default))
+
+
+def is_retryable(error):
+    """Return True if a request that raised `error` may succeed on a retry"""
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # urllib errors have a `code`, requests errors a `response.status_code`
+    status = getattr(error, "code", None) or getattr(
+        getattr(error, "response", None), "status_code", None
+    )
+    if status in RETRYABLE_STATUS:
+        return True
+    text = str(error).lower()
+    return any(pattern in text for pattern in RETRYABLE)
+
+
+class _Bucket:
+    """The shared token bucket, locked for the duration of a `with` block"""
+
+    def __init__(self):
+        self.path = os.path.join(cache.cache_dir(), "ratelimit.json")
+        self.rate = _setting("EEHARVEST_RATE_LIMIT", 10)
+        self.burst = max(_setting("EEHARVEST_RATE_BURST", 20), 1)
+
+    def __enter__(self):
+        _lock.acquire()
+        try:
+            self._file = open(self.path, "a+")
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            self._file.seek(0)
+            state = json.loads(self._file.read())
+            self.tokens, self.updated = state["tokens"], state["updated"]
+        except (ValueError, KeyError, TypeError):
+            # New or damaged state file, start with a full bucket
+            self.tokens, self.updated = self.burst, time.time()
+        except BaseException:
+            _lock.release()
+            raise
+        now = time.time()
+        self.tokens = min(
+            self.burst, self.tokens + max(now - self.updated, 0) * self.rate
+        )
+        self.updated = now
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            self._file.seek(0)
+            self._file.truncate()
+            json.dump({"tokens": self.tokens, "updated": self.updated}, self._file)
+            self._file.flush()
+        finally:
+            self._file.close()
+            _lock.release()
+
+
+def acquire():
+    """Wait until a request may be sent, according to the shared bucket"""
+    if _setting("EEHARVEST_RATE_LIMIT", 10) <= 0:
+        return
+    while True:
+        with _Bucket() as bucket:
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return
+            wait = (1 - bucket.tokens) / bucket.rate
+        time.sleep(wait)
+
+
+def penalise():
+    """Empty the shared bucket, so that all processes pause for a refill"""
+    if _setting("EEHARVEST_RATE_LIMIT", 10) <= 0:
+        return
+    with _Bucket() as bucket:
+        bucket.tokens = min(bucket.tokens, 0)
+
+
+def call(fn, *args, base_delay=1.0, max_delay=60.0, **kwargs):
+    """
+    Call `fn(*args, **kwargs)` under the rate limit, retrying errors that are
+    worth retrying with jittered exponential backoff
+
+    Parameters
+    ----------
+    fn : callable
+        The function that makes the request
+    base_delay : float, optional
+        Upper bound in seconds of the delay before the first retry, which
+        doubles with every retry, by default 1.0
+    max_delay : float, optional
+        Upper bound in seconds of the delay before any retry, by default 60.0
+
+    Returns
+    -------
+    obj
+        The result of `fn`
+    """
+    retries = int(_setting("EEHARVEST_MAX_RETRIES", 5))
+    attempt = 0
+    while True:
+        acquire()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt >= retries or not is_retryable(e):
+                raise
+            penalise()
+            # "Full jitter" spreads out the retries of concurrent callers
+            delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+            attempt += 1
+            msg.warn(
+                f"{type(e).__name__}: {e}. Retrying in {delay:.1f}s "
+                + f"({attempt}/{retries})"
+            )
+            time.sleep(delay)
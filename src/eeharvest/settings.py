@@ -1,28 +1,75 @@
-import pandas as pd
-import yamale
+import copy
+import os
+import threading
+
 import yaml
 from importlib_resources import files
 
 from eeharvest import msg
 
+# The C loader of libyaml is much faster, but is not always compiled in
+_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-def read(path, loader=yaml.SafeLoader):
-    """Read a yaml file and return a dict"""
-    with open(path, "r") as f:
-        doc = yaml.load(f, Loader=loader)
-    return doc
+# Parsed config files and compiled schemas, keyed by path, loader and the
+# modification time and size of the file, so that changed files are read again
+_configs = {}
+_schemas = {}
+_lock = threading.Lock()
 
 
-def validate_schema(path, schema_path=None):
-    """Validate a yaml config file against a schema file"""
+def _file_key(path, *extra):
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size) + extra
+
+
+def read(path, loader=_LOADER):
+    """
+    Read a yaml file and return a dict
+
+    Files are only parsed again when they change, and every call returns its
+    own copy of the dict.
+    """
+    key = _file_key(path, loader)
+    with _lock:
+        doc = _configs.get(key)
+    if doc is None:
+        with open(path, "r") as f:
+            doc = yaml.load(f, Loader=loader)
+        with _lock:
+            _configs[key] = doc
+    return copy.deepcopy(doc)
+
+
+def _schema(schema_path=None):
+    """Return the compiled yamale schema, which is only compiled once"""
+    import yamale
+
     if schema_path is None:
         schema_path = files("eeharvest.data").joinpath("schema.yaml")
-    schema = yamale.make_schema(str(schema_path))
-    try:
-        data = yamale.make_data(path)
-    except (FileNotFoundError, TypeError):
-        path = yaml.dump(path)
-        data = yamale.make_data(content=str(path))
+    key = _file_key(str(schema_path))
+    with _lock:
+        schema = _schemas.get(key)
+    if schema is None:
+        schema = yamale.make_schema(str(schema_path))
+        with _lock:
+            _schemas[key] = schema
+    return schema
+
+
+def validate_schema(path, schema_path=None):
+    """
+    Validate a yaml config file, or a config dict, against a schema file
+    """
+    import yamale
+
+    schema = _schema(schema_path)
+    if isinstance(path, dict):
+        data = [(path, None)]
+    else:
+        try:
+            data = [(read(path) or {}, str(path))]
+        except (FileNotFoundError, TypeError):
+            data = yamale.make_data(content=str(yaml.dump(path)))
     try:
         yamale.validate(schema, data, strict=False)
         # msg.success("YAML schema validated")
@@ -41,6 +88,7 @@ def _add_missing_keys(config):
         "colname_lat": None,
         "colname_lng": None,
         "target_bbox": None,
+        "cluster_size": None,
         "target_res": None,
         "date_min": None,
         "date_max": None,
@@ -54,8 +102,21 @@ def _add_missing_keys(config):
                     "mask_probability": None,
                     "reduce": None,
                     "spectral": None,
+                    "max_cloud": None,
+                    "least_cloudy": None,
+                },
+                "aggregate": {
+                    "frequency": None,
+                    "reducer": None,
+                },
+                "download": {
+                    "bands": None,
+                    "mode": None,
+                    "tiles": None,
+                    "workers": None,
+                    "max_cache_mb": None,
+                    "cog": None,
                 },
-                "download": {"bands": None},
             }
         },
     }
@@ -73,17 +134,7 @@ def _add_missing_keys(config):
 
 def _validate_bbox(d, buffer=0.05):
     """Checks whether a bounding box can be parsed from infile or target_bbox"""
-    if d["infile"] is not None:
-        # Extract csv from infile using pandas
-        try:
-            df = pd.read_csv(d["infile"])
-        except (FileNotFoundError, ValueError):
-            msg.err("Invalid file path, please check `infile` value in config")
-            raise ValueError("Could not read csv file")
-    else:
-        pass
-
-    # Check if target_bbox is defined
+    # Check if target_bbox is defined, in which case infile is not needed
     if d["target_bbox"] is not None:
         bbox = d["target_bbox"]
         return bbox
@@ -97,17 +148,261 @@ def _validate_bbox(d, buffer=0.05):
             " Please check config file for issues or typos in these keys."
         )
     else:
-        long = d["colname_lng"]
-        lat = d["colname_lat"]
-        bbox = (
-            min(df[long]) - buffer,
-            min(df[lat]) - buffer,
-            max(df[long]) + buffer,
-            max(df[lat]) + buffer,
+        xmin, ymin, xmax, ymax = _infile_extent(
+            d["infile"], d["colname_lng"], d["colname_lat"]
         )
+        bbox = (xmin - buffer, ymin - buffer, xmax + buffer, ymax + buffer)
         return bbox
 
 
+def _infile_extent(infile, colname_lng, colname_lat, chunksize=1_000_000):
+    """
+    Calculate the extent [xmin, ymin, xmax, ymax] of the points in infile
+
+    The file is read in chunks and only the coordinate columns are loaded,
+    so memory use does not grow with the size of the file.
+    """
+    xmin = ymin = float("inf")
+    xmax = ymax = float("-inf")
+    for chunk in _iter_points(infile, colname_lng, colname_lat, chunksize):
+        xmin = min(xmin, chunk[colname_lng].min())
+        xmax = max(xmax, chunk[colname_lng].max())
+        ymin = min(ymin, chunk[colname_lat].min())
+        ymax = max(ymax, chunk[colname_lat].max())
+    if xmin == float("inf"):
+        raise ValueError(f"No points found in {infile}")
+    return [float(xmin), float(ymin), float(xmax), float(ymax)]
+
+
+def _cluster_points(infile, colname_lng, colname_lat, cell_size, buffer=0.05):
+    """
+    Group the points in infile into compact clusters, each with its own
+    bounding box
+
+    Points are bucketed into a grid of `cell_size` degrees and occupied cells
+    that touch (including diagonally) are merged into one cluster, so points
+    that are separated by at least one empty cell end up in different
+    clusters. Like `_infile_extent()`, the file is read in chunks, and memory
+    use only grows with the number of occupied cells.
+
+    Returns a list of dicts with keys "id", "bbox" ([xmin, ymin, xmax, ymax]
+    of the points in the cluster plus `buffer`) and "points" (the number of
+    points in the cluster).
+    """
+    import numpy as np
+
+    if cell_size <= 0:
+        raise ValueError("`cell_size` must be greater than 0")
+    # Extent and number of points of every occupied grid cell
+    cells = {}
+    for chunk in _iter_points(infile, colname_lng, colname_lat, 1_000_000):
+        chunk = chunk.assign(
+            ix=np.floor(chunk[colname_lng] / cell_size).astype("int64"),
+            iy=np.floor(chunk[colname_lat] / cell_size).astype("int64"),
+        )
+        stats = chunk.groupby(["ix", "iy"]).agg(
+            xmin=(colname_lng, "min"),
+            ymin=(colname_lat, "min"),
+            xmax=(colname_lng, "max"),
+            ymax=(colname_lat, "max"),
+            points=(colname_lng, "size"),
+        )
+        for cell, row in zip(stats.index, stats.itertuples(index=False)):
+            old = cells.get(cell)
+            if old is None:
+                cells[cell] = list(row)
+            else:
+                cells[cell] = [
+                    min(old[0], row.xmin),
+                    min(old[1], row.ymin),
+                    max(old[2], row.xmax),
+                    max(old[3], row.ymax),
+                    old[4] + row.points,
+                ]
+    if not cells:
+        raise ValueError(f"No points found in {infile}")
+
+    # Merge neighbouring cells with union-find
+    parent = {cell: cell for cell in cells}
+
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    for ix, iy in cells:
+        for dx, dy in ((1, -1), (1, 0), (1, 1), (0, 1)):
+            neighbour = (ix + dx, iy + dy)
+            if neighbour in cells:
+                parent[find(neighbour)] = find((ix, iy))
+
+    groups = {}
+    for cell in sorted(cells):
+        groups.setdefault(find(cell), []).append(cells[cell])
+    clusters = []
+    for n, members in enumerate(groups.values()):
+        clusters.append(
+            {
+                "id": f"cluster_{n:03d}",
+                "bbox": [
+                    float(min(m[0] for m in members)) - buffer,
+                    float(min(m[1] for m in members)) - buffer,
+                    float(max(m[2] for m in members)) + buffer,
+                    float(max(m[3] for m in members)) + buffer,
+                ],
+                "points": int(sum(m[4] for m in members)),
+            }
+        )
+    return clusters
+
+
+def _parse_regions(coords):
+    """
+    Read several areas of interest from `coords`, which may be a list of
+    bounding boxes [xmin, ymin, xmax, ymax] or a GeoJSON FeatureCollection
+
+    See `_feature_id()` for the IDs of features, and regions without an ID
+    are numbered. Returns a list of dicts with keys "id" and "bbox", and the
+    GeoJSON "geometry" of features, or None if `coords` holds a single area of
+    interest.
+    """
+    import re
+
+    if isinstance(coords, dict) and coords.get("type") == "FeatureCollection":
+        regions = [
+            {
+                "id": _feature_id(feature, n, "region"),
+                "bbox": _geometry_bbox(feature["geometry"]["coordinates"]),
+                "geometry": feature["geometry"],
+            }
+            for n, feature in enumerate(coords["features"])
+        ]
+    elif (
+        isinstance(coords, (list, tuple))
+        and len(coords) > 0
+        and all(isinstance(c, (list, tuple)) and len(c) == 4 for c in coords)
+    ):
+        regions = [
+            {"id": f"region_{n:03d}", "bbox": [float(v) for v in bbox]}
+            for n, bbox in enumerate(coords)
+        ]
+    else:
+        return None
+    if not regions:
+        raise ValueError("No regions found in `coords`")
+    # IDs are used in file names
+    for region in regions:
+        region["id"] = re.sub(r"[^\w.-]", "_", region["id"])
+    ids = [r["id"] for r in regions]
+    if len(set(ids)) < len(ids):
+        raise ValueError("Region IDs must be unique")
+    return regions
+
+
+def _feature_id(feature, n, prefix):
+    """
+    The ID of the `n`th GeoJSON feature: its "id", or the "id" in its
+    properties, or `prefix` and `n`
+    """
+    properties = feature.get("properties") or {}
+    id = feature.get("id", properties.get("id"))
+    return f"{prefix}_{n:03d}" if id is None else str(id)
+
+
+def _read_features(features):
+    """
+    Read the features of a GeoJSON FeatureCollection, from a dict or a file
+
+    Returns a list of (ID, geometry) tuples, see `_feature_id()`.
+    """
+    import json
+
+    if not isinstance(features, dict):
+        with open(features, "r") as f:
+            features = json.load(f)
+    if features.get("type") != "FeatureCollection":
+        raise ValueError("`features` should be a GeoJSON FeatureCollection")
+    return [
+        (_feature_id(feature, n, "zone"), feature["geometry"])
+        for n, feature in enumerate(features["features"])
+    ]
+
+
+def _geometry_bbox(coordinates):
+    """Bounding box [xmin, ymin, xmax, ymax] of GeoJSON geometry coordinates"""
+    xs, ys = [], []
+
+    def walk(c):
+        if isinstance(c[0], (int, float)):
+            xs.append(c[0])
+            ys.append(c[1])
+        else:
+            for i in c:
+                walk(i)
+
+    walk(coordinates)
+    return [float(min(xs)), float(min(ys)), float(max(xs)), float(max(ys))]
+
+
+def _regions_bbox(regions):
+    """Bounding box [xmin, ymin, xmax, ymax] of all regions"""
+    return [
+        min(r["bbox"][0] for r in regions),
+        min(r["bbox"][1] for r in regions),
+        max(r["bbox"][2] for r in regions),
+        max(r["bbox"][3] for r in regions),
+    ]
+
+
+def _iter_points(infile, colname_lng, colname_lat, chunksize=1000):
+    """
+    Read point coordinates from a csv or Parquet file, or a DataFrame, in
+    chunks
+
+    Only the longitude and latitude columns are read from files. Yields
+    DataFrames with a "point_id" column, which is the row number of the point
+    in `infile`, and the longitude and latitude columns as floats.
+    """
+    import pandas as pd
+
+    columns = [colname_lng, colname_lat]
+    dtypes = {colname_lng: "float64", colname_lat: "float64"}
+    if isinstance(infile, pd.DataFrame):
+        chunks = (
+            infile.iloc[start : start + chunksize][columns]
+            for start in range(0, len(infile), chunksize)
+        )
+    elif str(infile).endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet files requires `pyarrow`")
+
+        try:
+            batches = pq.ParquetFile(infile).iter_batches(
+                batch_size=chunksize, columns=columns
+            )
+        except (FileNotFoundError, ValueError, OSError):
+            msg.err("Invalid file path, please check `infile` value in config")
+            raise ValueError("Could not read parquet file")
+        chunks = (batch.to_pandas() for batch in batches)
+    else:
+        try:
+            chunks = pd.read_csv(
+                infile, usecols=columns, dtype=dtypes, chunksize=chunksize
+            )
+        except (FileNotFoundError, ValueError):
+            msg.err("Invalid file path, please check `infile` value in config")
+            raise ValueError("Could not read csv file")
+    offset = 0
+    for chunk in chunks:
+        chunk = chunk[columns].astype(dtypes).reset_index(drop=True)
+        chunk.insert(0, "point_id", range(offset, offset + len(chunk)))
+        offset += len(chunk)
+        yield chunk
+
+
 def _detect_multi_collection(config):
     """
     Detects whether multiple collections are specified in the config file.
@@ -1,22 +1,51 @@
+import contextvars
+import datetime
 import hashlib
 import math
 import os
-from contextlib import contextmanager, redirect_stderr, redirect_stdout
-from os import devnull
+import re
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
 
 import ee
 
+from eeharvest import metrics, ratelimit
 
-@contextmanager
-def _suppress():
+
+def _getinfo(obj):
+    """
+    Evaluate an Earth Engine object with `getInfo()`
+
+    All requests for values go through here, so that they are rate limited
+    and retried (see `ratelimit`), and their number and latency are recorded
+    in the active `metrics.Metrics` object.
     """
-    A context manager that redirects stdout and stderr to devnull
+    start = time.perf_counter()
+    try:
+        return ratelimit.call(obj.getInfo)
+    finally:
+        metrics.record_getinfo(time.perf_counter() - start)
 
-    From https://stackoverflow.com/a/52442331.
+
+def _in_context(fn):
+    """
+    Wrap `fn` to run in a copy of the caller's context, so that context
+    variables such as the active metrics carry over to worker threads
     """
-    with open(devnull, "w") as fnull:
-        with redirect_stderr(fnull) as err, redirect_stdout(fnull) as out:
-            yield (err, out)
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time
+        return context.copy().run(fn, *args, **kwargs)
+
+    return run
 
 
 def _imageID_to_tifID(collection):
@@ -25,7 +54,53 @@ def _imageID_to_tifID(collection):
     IDs as a list of filenames in .tif
     """
     idList = collection.aggregate_array("system:index")
-    return [f"{i}.tif" for i in idList.getInfo()]
+    return [f"{i}.tif" for i in _getinfo(idList)]
+
+
+def _describe(obj):
+    """
+    Describe an Earth Engine image or image collection in a single request
+
+    Bundles the number of images, the band names and types, the image IDs
+    and the projection of the first band into one ee.Dictionary so that they
+    can be evaluated with a single call to `getInfo()`.
+
+    Parameters
+    ----------
+    obj : obj
+        ee.Image or ee.ImageCollection object
+
+    Returns
+    -------
+    dict
+        A dict with keys "count", "bands", "types", "ids" and "projection".
+        For an ee.ImageCollection, "bands", "types" and "projection" are taken
+        from the first image, and "ids" lists the "system:index" of every
+        image. For an ee.Image, "ids" is an empty list
+    """
+    if isinstance(obj, ee.image.Image):
+        count = ee.Number(1)
+        first = obj
+        ids = ee.List([])
+    else:
+        count = obj.size()
+        first = ee.Image(obj.first())
+        ids = obj.aggregate_array("system:index")
+    bands = ee.List(ee.Algorithms.If(count.gt(0), first.bandNames(), ee.List([])))
+    types = ee.Algorithms.If(count.gt(0), first.bandTypes(), ee.Dictionary({}))
+    projection = ee.Algorithms.If(
+        bands.size().gt(0), first.select(0).projection(), None
+    )
+    info = ee.Dictionary(
+        {
+            "count": count,
+            "bands": bands,
+            "types": types,
+            "ids": ids,
+            "projection": projection,
+        }
+    )
+    return _getinfo(info)
 
 
 def _stretch_minmax(
@@ -75,7 +150,7 @@ def _stretch_minmax(
             bands = ee.List(
                 ee.Algorithms.If(names.size().gte(3), names.slice(0, 3), names.slice(0))
             )
-            bands = bands.getInfo()
+            bands = _getinfo(bands)
 
         image = ee_image.select(bands)
         geom = region or image.geometry()
@@ -96,11 +171,11 @@ def _stretch_minmax(
 
         if len(bands) == 1:
             band = bands[0]
-            values = minmax(band).getInfo()
+            values = _getinfo(minmax(band))
             minv = values[0]
             maxv = values[1]
         else:
-            values = ee.List(bands).map(minmax).getInfo()
+            values = _getinfo(ee.List(bands).map(minmax))
             minv = [values[0][0], values[1][0], values[2][0]]
             maxv = [values[0][1], values[1][1], values[2][1]]
     if by == "sd":
@@ -124,11 +199,11 @@ def _stretch_minmax(
         # Make calculations based on no. of bands used
         if len(bands) == 1:
             band = bands[0]
-            values = min_max(band, mean.get(band)).getInfo()
+            values = _getinfo(min_max(band, mean.get(band)))
             minv = values[0]
             maxv = values[1]
         else:
-            values = mean.map(min_max).select(bands).getInfo()
+            values = _getinfo(mean.map(min_max).select(bands))
             minv = [values[bands[0]][0], values[bands[1]][0], values[bands[2]][0]]
             maxv = [values[bands[0]][1], values[bands[1]][1], values[bands[2]][1]]
     return [minv, maxv]
@@ -199,6 +274,162 @@ def _make_path(dir, filename):
 #     return out
 
 
+def _split_bbox(bbox, tiles):
+    """
+    Split a bounding box into a grid of smaller bounding boxes
+
+    Parameters
+    ----------
+    bbox : list of float
+        Bounding box in the form [xmin, ymin, xmax, ymax]
+    tiles : int or list of int
+        Number of tiles along each axis. An integer `n` produces an n x n grid,
+        while a list of two integers is read as [columns, rows]
+
+    Returns
+    -------
+    list
+        A list of bounding boxes, ordered row by row from the top left corner
+    """
+    if isinstance(tiles, int):
+        ncol, nrow = tiles, tiles
+    else:
+        ncol, nrow = tiles
+    xmin, ymin, xmax, ymax = bbox
+    dx = (xmax - xmin) / ncol
+    dy = (ymax - ymin) / nrow
+    return [
+        [
+            xmin + col * dx,
+            ymax - (row + 1) * dy,
+            xmin + (col + 1) * dx,
+            ymax - row * dy,
+        ]
+        for row in range(nrow)
+        for col in range(ncol)
+    ]
+
+
+def _region_to_bbox(region):
+    """
+    Return a bounding box [xmin, ymin, xmax, ymax] from a list of coordinates or
+    an ee.Geometry object
+    """
+    if isinstance(region, (list, tuple)) and isinstance(region[0], (list, tuple)):
+        # A list of [x, y] pairs
+        xs = [i[0] for i in region]
+        ys = [i[1] for i in region]
+        return [min(xs), min(ys), max(xs), max(ys)]
+    if isinstance(region, (list, tuple)):
+        return list(region)
+    ring = _getinfo(region.bounds().coordinates())[0]
+    xs = [i[0] for i in ring]
+    ys = [i[1] for i in ring]
+    return [min(xs), min(ys), max(xs), max(ys)]
+
+
+# Scene metadata with the percentage of cloudy pixels, by collection prefix
+_CLOUD_PROPERTIES = {
+    "COPERNICUS/S2": "CLOUDY_PIXEL_PERCENTAGE",
+    "LANDSAT/": "CLOUD_COVER",
+}
+
+
+def _cloud_property(collection):
+    """
+    Return the name of the scene cloud cover property of a collection, or
+    None if it is not known
+    """
+    for prefix, name in _CLOUD_PROPERTIES.items():
+        if collection.startswith(prefix):
+            return name
+    return None
+
+
+def _bbox_to_polygon(bbox):
+    """
+    Return the coordinates of a polygon with a single ring from a bounding box
+    [xmin, ymin, xmax, ymax]
+    """
+    xmin, ymin, xmax, ymax = bbox
+    return [[[xmin, ymin], [xmax, ymin], [xmax, ymax], [xmin, ymax], [xmin, ymin]]]
+
+
+# GeoTIFF data types of downloads: the ee.Image cast and the size in bytes.
+# Integer types are listed from the smallest, see `_pixel_type()`.
+DTYPES = {
+    "uint8": ("toUint8", 1),
+    "int8": ("toInt8", 1),
+    "uint16": ("toUint16", 2),
+    "int16": ("toInt16", 2),
+    "uint32": ("toUint32", 4),
+    "int32": ("toInt32", 4),
+    "float32": ("toFloat", 4),
+    "float64": ("toDouble", 8),
+}
+
+# Value of masked pixels in float downloads
+NODATA = -9999
+
+
+def _pixel_type(types):
+    """
+    Pick the data type and nodata value of a download from the Earth Engine
+    pixel types of its bands, e.g. the values of `ee.Image.bandTypes()`
+
+    Float bands are downloaded as float32, or float64 if any band is a double,
+    with `NODATA` for masked pixels. Integer bands keep the smallest integer
+    type that holds their range and a nodata value outside of it: the largest
+    value of unsigned types, the smallest of signed ones. Returns a (dtype,
+    nodata) tuple, with a dtype from `DTYPES`.
+    """
+    types = list(types)
+    if not types:
+        return "float32", NODATA
+    precisions = {t.get("precision") for t in types}
+    if "double" in precisions:
+        return "float64", NODATA
+    if precisions != {"int"}:
+        return "float32", NODATA
+    low = min(t.get("min", -(2**31)) for t in types)
+    high = max(t.get("max", 2**31 - 1) for t in types)
+    for dtype in ("uint8", "int8", "uint16", "int16", "uint32", "int32"):
+        bits = DTYPES[dtype][1] * 8
+        if dtype.startswith("u"):
+            lowest, highest = 0, 2**bits - 1
+            nodata = highest
+        else:
+            lowest, highest = -(2 ** (bits - 1)), 2 ** (bits - 1) - 1
+            nodata = lowest
+        if lowest <= low and high <= highest and not low <= nodata <= high:
+            return dtype, nodata
+    # No integer type has room for a nodata value
+    return "float64", NODATA
+
+
+def _region_geometry(region):
+    """
+    The GeoJSON geometry of a region from `settings._parse_regions()`: the
+    geometry of its feature, or else its bounding box
+    """
+    if region.get("geometry") is not None:
+        return region["geometry"]
+    return {"type": "Polygon", "coordinates": _bbox_to_polygon(region["bbox"])}
+
+
+def _mosaic(paths, path):
+    """
+    Mosaic a list of GeoTIFF files into a single GeoTIFF file
+
+    The mosaic is written block by block to `path` so that large outputs do
+    not need to fit in memory.
+    """
+    from rasterio.merge import merge
+
+    merge(list(paths), dst_path=path)
+    return path
+
+
 def _generate_dir(dir):
     """
     Create directory with subfolder if it doesn't exist
@@ -208,85 +439,6 @@ def _generate_dir(dir):
     return dir
 
 
-# def pixels_to_bytes(ee_image, scale):
-#     """
-#     Convert image pixel information to bytes for size estimation. From
-#     https://gis.stackexchange.com/a/433027
-
-#     Parameters
-#     ----------
-#     ee_image : ee.Image object
-#         An ee.Image object
-#     scale : int
-#         The scale of the image in meters
-
-#     Returns
-#     -------
-#     float
-#         Size of image in bytes
-#     """
-#     imageDescription = ee.Dictionary(ee.Algorithms.Describe(ee_image))
-#     bands = ee.List(imageDescription.get("bands"))
-
-#     def getBits(band):
-#         dataType = ee.Dictionary(ee.Dictionary(band).get("data_type"))
-#         precision = dataType.getString("precision")
-#         out = ee.Algorithms.If(
-#             precision.equals("int"),
-#             intBits(dataType),
-#             ee.Algorithms.If(precision.equals("float"), 32, 64),
-#         )
-#         return out
-
-#     def intBits(dataType):
-#         min = dataType.getNumber("min")
-#         max = dataType.getNumber("max")
-#         types = ee.FeatureCollection(
-#             [
-#                 ee.Feature(None, {"bits": 8, "min": -(2**7), "max": 2**7}),
-#                 ee.Feature(None, {"bits": 8, "min": 0, "max": 2**8}),
-#                 ee.Feature(
-#                     None,
-#                     {
-#                         "bits": 16,
-#                         "min": -(2**5),
-#                         "max": 2**5,
-#                     },
-#                 ),
-#                 ee.Feature(None, {"bits": 16, "min": 0, "max": 2**16}),
-#                 ee.Feature(
-#                     None,
-#                     {
-#                         "bits": 32,
-#                         "min": -(2**31),
-#                         "max": 2**31,
-#                     },
-#                 ),
-#                 ee.Feature(None, {"bits": 32, "min": 0, "max": 2**32}),
-#             ]
-#         )
-#         out = (
-#             types.filter(ee.Filter.lte("min", min))
-#             .filter(ee.Filter.gt("max", max))
-#             .merge(ee.FeatureCollection([ee.Feature(None, {"bits": 64})]))
-#             .first()
-#             .getNumber("bits")
-#         )
-#         return out
-
-#     bits = ee.Number(bands.map(getBits).reduce(ee.Reducer.sum()))
-#     pixelCount = (
-#         ee_image.geometry()
-#         .bounds()
-#         .area(scale)
-#         .divide(ee.Number(scale).pow(2))
-#         .sqrt()
-#         .ceil()
-#         .pow(2)
-#     )
-#     return bits.divide(8).multiply(pixelCount).ceil()
-
-
 def convert_size(size_bytes):
     """
     Convert size in bytes to appropriate unit.
@@ -309,6 +461,188 @@ def convert_size(size_bytes):
 #     return start, end_date
 
 
+def _imap_unordered(fn, iterable, workers=4):
+    """
+    Apply `fn` to each item of `iterable` in a thread pool and yield the
+    results as they complete
+
+    At most `2 * workers` items are read from `iterable` ahead of the results,
+    so long iterables (e.g. chunks read from a large file) are never held in
+    memory at once.
+    """
+    iterator = iter(iterable)
+    fn = _in_context(fn)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for item in iterator:
+            pending.add(executor.submit(fn, item))
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+# Worker threads shared by the async API. Their number bounds how many
+# blocking Earth Engine calls are in flight at once, and can be set with
+# EEHARVEST_ASYNC_WORKERS
+_async_executor = None
+_async_lock = threading.Lock()
+
+
+def _get_async_executor():
+    global _async_executor
+    with _async_lock:
+        if _async_executor is None:
+            _async_executor = ThreadPoolExecutor(
+                max_workers=int(os.environ.get("EEHARVEST_ASYNC_WORKERS", 16)),
+                thread_name_prefix="eeharvest",
+            )
+    return _async_executor
+
+
+async def _run_async(fn, *args, cancellable=False, **kwargs):
+    """
+    Run a blocking function in a worker thread and await its result
+
+    If `cancellable` is True, `fn` is passed a threading.Event as `cancel`,
+    which is set when the awaiting task is cancelled. The task then waits for
+    `fn` to stop at its next checkpoint and remove its partial files before
+    the cancellation is propagated.
+    """
+    import asyncio
+
+    cancel = threading.Event()
+    if cancellable:
+        kwargs["cancel"] = cancel
+    job = _get_async_executor().submit(_in_context(fn), *args, **kwargs)
+    future = asyncio.wrap_future(job)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel.set()
+        job.cancel()
+        await asyncio.wait([future])
+        if not future.cancelled():
+            # Retrieve the outcome so that it is not logged as unhandled
+            future.exception()
+        raise
+
+
+def _check_cancelled(cancel):
+    """Raise CancelledError if the threading.Event `cancel` has been set"""
+    if cancel is not None and cancel.is_set():
+        raise CancelledError()
+
+
+def _match_bands(all_bands, bands, reduce=None):
+    """
+    Match band names to the bands of an image
+
+    If the image was reduced, e.g. with "median", band names are suffixed
+    with the reducer ("NDVI" becomes "NDVI_median"), so bands are matched by
+    prefix instead.
+    """
+    bands = [bands] if isinstance(bands, str) else bands
+    if reduce is None:
+        return bands
+    new_bands = []
+    for item in all_bands:
+        for sub_item in bands:
+            if item.startswith(sub_item + "_"):
+                new_bands.append(item)
+                break
+    return new_bands
+
+
+class _TableWriter:
+    """
+    Write a table to a csv or Parquet file in batches
+
+    Batches can be written from several threads. The file is written under a
+    temporary name and only moved into place when the writer is closed
+    without errors. Parquet output requires `pyarrow`.
+
+    `dtypes` maps known columns to their types, e.g. {"NDVI": "float64"}, so
+    that they are kept, and typed, even when they are empty in the first
+    batch.
+    """
+
+    def __init__(self, path, dtypes=None):
+        self.path = path
+        self.dtypes = dict(dtypes or {})
+        self.format = "parquet" if path.endswith((".parquet", ".pq")) else "csv"
+        self.columns = None
+        self.rows = 0
+        self._part = path + ".part"
+        self._writer = None
+        self._lock = threading.Lock()
+        if self.format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("Writing Parquet files requires `pyarrow`")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(discard=exc_type is not None)
+
+    def write(self, records):
+        """Append a list of dicts, or a DataFrame, to the table"""
+        import pandas as pd
+
+        df = pd.DataFrame.from_records(records)
+        if df.empty:
+            return
+        with self._lock:
+            if self.columns is None:
+                self.columns = list(df.columns)
+                self.columns += [c for c in self.dtypes if c not in self.columns]
+            df = df.reindex(columns=self.columns).astype(self.dtypes)
+            if self.format == "csv":
+                df.to_csv(
+                    self._part,
+                    mode="a" if self.rows else "w",
+                    header=not self.rows,
+                    index=False,
+                )
+            else:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if self._writer is None:
+                    self._writer = pq.ParquetWriter(self._part, table.schema)
+                else:
+                    table = table.cast(self._writer.schema)
+                self._writer.write_table(table)
+            self.rows += len(df)
+
+    def close(self, discard=False):
+        """Finish the file, or delete it if `discard` is True"""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if discard:
+                if os.path.exists(self._part):
+                    os.remove(self._part)
+                return
+            if not os.path.exists(self._part):
+                # Nothing was written, but leave an empty table behind
+                if self.format == "csv":
+                    open(self._part, "w").close()
+                else:
+                    import pyarrow as pa
+                    import pyarrow.parquet as pq
+
+                    pq.write_table(pa.table({}), self._part)
+            os.replace(self._part, self.path)
+
+
 def _reduce_by_string(img, by="median"):
     """Reduce an ee.ImageCollection to a single ee.Image by evaluating a string"""
     if by.find("(") != -1:
@@ -318,6 +652,175 @@ def _reduce_by_string(img, by="median"):
     return eval(fun)
 
 
+def _zonal_reducer(names):
+    """
+    Combine reducers given by name, e.g. ["mean", "stdDev", "p90"], into one
+    ee.Reducer that shares its inputs
+
+    Names of the form "pNN" are percentiles. Returns the reducer and the
+    names of its outputs, e.g. ["min", "max"] for "minMax".
+    """
+    reducers = []
+    for name in names:
+        if re.fullmatch(r"p\d+(\.\d+)?", name):
+            reducers.append(ee.Reducer.percentile([float(name[1:])], [name]))
+        elif name.startswith("_") or not hasattr(ee.Reducer, name):
+            raise ValueError(f"Unknown reducer: {name}")
+        else:
+            reducers.append(getattr(ee.Reducer, name)())
+    # Reducers can have several outputs, ask Earth Engine for their names
+    info = _getinfo(
+        ee.List(
+            [
+                ee.Dictionary({"inputs": r.getInputs(), "outputs": r.getOutputs()})
+                for r in reducers
+            ]
+        )
+    )
+    outputs = []
+    for name, io in zip(names, info):
+        if len(io["inputs"]) != 1:
+            raise ValueError(
+                f"Reducer {name} takes {len(io['inputs'])} inputs, only "
+                "reducers of a single band are supported"
+            )
+        outputs += io["outputs"]
+    duplicated = sorted({o for o in outputs if outputs.count(o) > 1})
+    if duplicated:
+        raise ValueError(f"Reducers have the same output(s): {duplicated}")
+    reducer = reducers[0]
+    for other in reducers[1:]:
+        reducer = reducer.combine(other, sharedInputs=True)
+    return reducer, outputs
+
+
+def _zonal_columns(bands, outputs):
+    """
+    Map the names that `reduceRegions()` gives the statistics of `bands` to
+    "<band>_<output>" column names
+
+    Earth Engine names a single statistic of several bands after the band,
+    and several statistics of a single band after the statistic.
+    """
+    columns = [f"{b}_{o}" for b in bands for o in outputs]
+    if len(bands) == 1:
+        names = list(outputs)
+    elif len(outputs) == 1:
+        names = list(bands)
+    else:
+        names = columns
+    return dict(zip(names, columns))
+
+
+def _to_long(features, bands):
+    """
+    Turn sampled features with "point_id", "date" and band properties into
+    records with one "point_id", "date", "band" and "value" per band
+    """
+    records = []
+    for feature in features:
+        properties = feature["properties"]
+        for band in bands:
+            value = properties.get(band)
+            if value is not None:
+                records.append(
+                    {
+                        "point_id": int(properties["point_id"]),
+                        "date": properties["date"],
+                        "band": band,
+                        "value": float(value),
+                    }
+                )
+    return records
+
+
+def _time_windows(times, size):
+    """
+    Split image timestamps (milliseconds) into date ranges of at most `size`
+    images
+
+    Images with the same timestamp are kept in the same range, which can then
+    exceed `size`. Returns a list of (start, end, count) tuples, with `start`
+    inclusive and `end` exclusive as in `ee.ImageCollection.filterDate()`.
+    """
+    times = sorted(times)
+    windows = []
+    i = 0
+    while i < len(times):
+        j = min(i + size, len(times))
+        while i < j < len(times) and times[j] == times[j - 1]:
+            j -= 1
+        if j == i:
+            # A single timestamp holds more than `size` images
+            j = i + 1
+            while j < len(times) and times[j] == times[i]:
+                j += 1
+        end = times[j] if j < len(times) else times[-1] + 1
+        windows.append((times[i], end, j - i))
+        i = j
+    return windows
+
+
+def _to_date(value):
+    """Convert a date in YYYY-MM-DD or YYYY format, or a date, to a date"""
+    if isinstance(value, datetime.date):
+        return value
+    value = str(value)
+    if len(value) == 4:
+        return datetime.date(int(value), 1, 1)
+    return datetime.date.fromisoformat(value)
+
+
+# Meteorological seasons, named after their months and keyed by first month
+_SEASONS = {12: "DJF", 3: "MAM", 6: "JJA", 9: "SON"}
+
+
+def _periods(date_min, date_max, frequency="month"):
+    """
+    Split the dates from `date_min` (inclusive) to `date_max` (exclusive) into
+    periods
+
+    Weeks are counted from `date_min`, while months and meteorological
+    seasons (DJF, MAM, JJA and SON) follow the calendar, so the first and last
+    periods may be cut short. Returns a list of (label, start, end) tuples,
+    where labels can be used in band names, e.g. "2022_10_01" for the week
+    starting on 1 October 2022, "2022_10" for October 2022 and "2022_DJF" for
+    December 2022 to February 2023.
+    """
+    start, end = _to_date(date_min), _to_date(date_max)
+    if start >= end:
+        raise ValueError("`date_max` must be later than `date_min`")
+    periods = []
+    if frequency == "week":
+        step = start
+        while step < end:
+            following = step + datetime.timedelta(days=7)
+            periods.append((step.strftime("%Y_%m_%d"), step, min(following, end)))
+            step = following
+        return periods
+    if frequency == "month":
+        months, labels = 1, lambda d: d.strftime("%Y_%m")
+        first = start.month
+    elif frequency == "season":
+        months, labels = 3, lambda d: f"{d.year}_{_SEASONS[d.month]}"
+        first = start.month - start.month % 3
+    else:
+        raise ValueError("`frequency` must be one of 'week', 'month' or 'season'")
+    # Month numbers are counted from year 0 to make stepping across years easy
+    step = start.year * 12 + first - 1
+    while True:
+        year, month = divmod(step, 12)
+        period_start = datetime.date(year, month + 1, 1)
+        if period_start >= end:
+            return periods
+        year, month = divmod(step + months, 12)
+        period_end = datetime.date(year, month + 1, 1)
+        periods.append(
+            (labels(period_start), max(period_start, start), min(period_end, end))
+        )
+        step += months
+
+
 def _update_nested(source, *new_mappings):
     updated_source = source.copy()
     for new_map in new_mappings:
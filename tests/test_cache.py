@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+from eeharvest import cache
+
+
+@pytest.fixture
+def cachedir(tmp_path, monkeypatch):
+    """Fixture for an empty cache directory"""
+    monkeypatch.setenv("EEHARVEST_CACHE_DIR", str(tmp_path.joinpath("cache")))
+    cache.clear()
+    yield tmp_path
+    cache.clear()
+
+
+def test_fetch_json_caches_in_memory_and_on_disk(cachedir):
+    """fetch_json: a document is downloaded once and then read from the cache"""
+    source = cachedir.joinpath("doc.json")
+    source.write_text(json.dumps({"a": 1}))
+    url = source.as_uri()
+    assert cache.fetch_json(url, "doc") == {"a": 1}
+    assert cachedir.joinpath("cache", "doc.json").exists()
+
+    # Changes at the source are not seen until the TTL has expired
+    source.write_text(json.dumps({"a": 2}))
+    assert cache.fetch_json(url, "doc") == {"a": 1}
+    cache.clear()
+    assert cache.fetch_json(url, "doc") == {"a": 1}
+    cache.clear()
+    assert cache.fetch_json(url, "doc", ttl=0) == {"a": 2}
+
+
+def test_fetch_json_falls_back_to_disk_then_snapshot(cachedir, capsys):
+    """fetch_json: stale or bundled copies are used when offline"""
+    source = cachedir.joinpath("doc.json")
+    source.write_text(json.dumps({"a": 1}))
+    url = source.as_uri()
+    cache.fetch_json(url, "doc")
+    cache.clear()
+    source.unlink()
+    assert cache.fetch_json(url, "doc", ttl=0) == {"a": 1}
+    assert "using local copy" in capsys.readouterr().out
+
+    catalog = cache.fetch_json(url, "catalog", snapshot="gee_catalog.json")
+    assert {"id": "LANDSAT/LC08/C02/T1_L2", "type": "image_collection"} in catalog
+
+    with pytest.raises(OSError):
+        cache.fetch_json(url, "nothing")
+
+
+def test_download_key_depends_on_graph_region_and_scale(ee_image, coords):
+    """download_key: identical requests share a key, different ones do not"""
+    key = cache.download_key(ee_image, coords, "EPSG:4326", 100)
+    assert key == cache.download_key(ee_image, coords, "EPSG:4326", 100)
+    assert key != cache.download_key(ee_image, coords, "EPSG:4326", 30)
+    assert key != cache.download_key(ee_image.select(0), coords, "EPSG:4326", 100)
+    assert key != cache.download_key(ee_image, coords[::-1], "EPSG:4326", 100)
+
+
+def test_download_cache_counts_hits_and_evicts_least_recently_used(tmp_path):
+    """DownloadCache: hits and misses are counted and old files are evicted"""
+    store = cache.DownloadCache(str(tmp_path), max_size=25)
+    for name in ["a.tif", "b.tif"]:
+        assert store.get(name) is None
+        tmp_path.joinpath(name).write_bytes(b"0" * 10)
+        store.put(name)
+    assert store.get("a.tif") == str(tmp_path.joinpath("a.tif"))
+
+    # "b.tif" is now the least recently used file and goes first
+    tmp_path.joinpath("c.tif").write_bytes(b"0" * 10)
+    store.put("c.tif")
+    assert not tmp_path.joinpath("b.tif").exists()
+    assert tmp_path.joinpath("a.tif").exists()
+
+    stats = store.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["files"] == 2
+    assert stats["size"] == 20
+
+
+def _put_many(directory, prefix, n):
+    store = cache.DownloadCache(directory)
+    for i in range(n):
+        name = f"{prefix}_{i}.tif"
+        with open(os.path.join(directory, name), "wb") as f:
+            f.write(b"0")
+        store.put(name)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs fork and fcntl")
+def test_download_cache_is_shared_between_processes(tmp_path):
+    processes = [
+        multiprocessing.get_context("fork").Process(
+            target=_put_many, args=(str(tmp_path), prefix, 20)
+        )
+        for prefix in ["a", "b", "c"]
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert cache.DownloadCache(str(tmp_path)).stats()["files"] == 60
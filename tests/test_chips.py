@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from eeharvest import arc2meter, chips
+
+
+def test_calc_meter2deg_is_vectorized():
+    dx, dy = arc2meter.calc_meter2deg(1000, np.array([0.0, -60.0]))
+    assert dx.shape == dy.shape == (2,)
+    # a degree of longitude shrinks towards the poles
+    assert dx[1] == pytest.approx(2 * dx[0], rel=0.01)
+    assert dy[0] == pytest.approx(1000 / 110574, rel=0.01)
+
+
+def test_grids_are_centred_on_points():
+    grids = chips.grids([149.0, 150.0], [-30.0, -31.0], 8, 30)
+    assert len(grids) == 2
+    grid = grids[0]
+    assert grid["dimensions"] == {"width": 8, "height": 8}
+    t = grid["affineTransform"]
+    assert t["translateX"] + 4 * t["scaleX"] == pytest.approx(149.0)
+    assert t["translateY"] + 4 * t["scaleY"] == pytest.approx(-30.0)
+    assert t["scaleY"] < 0
+
+
+def test_circle_masks_corners():
+    mask = chips.circle(5)
+    assert mask[2, 2] and mask[0, 2]
+    assert not mask[0, 0]
+
+
+def test_chip_writer_npz_shards(tmpdir):
+    path = str(tmpdir.join("chips"))
+    with chips.ChipWriter(path, ["B1", "B2"], 4, shard_size=2) as writer:
+        for i in range(5):
+            writer.write(i, 149.0 + i, -30.0, np.full((2, 4, 4), i, "float32"))
+    data = chips.read_npz(path)
+    assert data["chips"].shape == (5, 2, 4, 4)
+    assert sorted(data["point_id"]) == [0, 1, 2, 3, 4]
+    assert data["bands"] == ["B1", "B2"]
+    assert len(tmpdir.join("chips").listdir()) == 3
+
+
+def test_chip_writer_discards_on_error(tmpdir):
+    path = str(tmpdir.join("chips"))
+    with pytest.raises(RuntimeError):
+        with chips.ChipWriter(path, ["B1"], 2) as writer:
+            writer.write(0, 149.0, -30.0, np.zeros((1, 2, 2)))
+            raise RuntimeError("failed")
+    assert tmpdir.listdir() == []
+
+
+def test_chip_writer_keeps_previous_output_on_error(tmpdir):
+    path = str(tmpdir.join("chips"))
+    with chips.ChipWriter(path, ["B1"], 2) as writer:
+        writer.write(0, 149.0, -30.0, np.ones((1, 2, 2)))
+    with pytest.raises(RuntimeError):
+        with chips.ChipWriter(path, ["B1"], 2) as writer:
+            writer.write(1, 149.0, -30.0, np.zeros((1, 2, 2)))
+            raise RuntimeError("failed")
+    assert list(chips.read_npz(path)["point_id"]) == [0]
+    with chips.ChipWriter(path, ["B1"], 2) as writer:
+        writer.write(2, 149.0, -30.0, np.zeros((1, 2, 2)))
+    assert list(chips.read_npz(path)["point_id"]) == [2]
+
+
+def test_chip_writer_hdf5(tmpdir):
+    h5py = pytest.importorskip("h5py")
+    path = str(tmpdir.join("chips.h5"))
+    with chips.ChipWriter(path, ["B1"], 3, shard_size=2) as writer:
+        for i in range(3):
+            writer.write(i, 149.0, -30.0, np.ones((1, 3, 3)))
+    with h5py.File(path) as f:
+        assert f["chips"].shape == (3, 1, 3, 3)
+        assert list(f["point_id"][:]) == [0, 1, 2]
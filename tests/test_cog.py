@@ -0,0 +1,66 @@
+import pytest
+
+from eeharvest import cog
+
+
+@pytest.fixture
+def geotiff(tmp_path):
+    np = pytest.importorskip("numpy")
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    path = tmp_path / "image.tif"
+    with rasterio.open(
+        path,
+        "w",
+        driver="GTiff",
+        width=1200,
+        height=1000,
+        count=2,
+        dtype="float32",
+        crs="EPSG:4326",
+        transform=from_origin(149.8, -30.3, 0.0001, 0.0001),
+    ) as dst:
+        dst.write(np.random.rand(2, 1000, 1200).astype("float32"))
+    return str(path)
+
+
+def test_convert_writes_compressed_tiled_cog_with_overviews(geotiff, tmp_path):
+    import rasterio
+
+    with rasterio.open(geotiff) as src:
+        before = src.read()
+    assert cog.convert([geotiff], workers=1, compress="zstd", blocksize=256) == [
+        geotiff
+    ]
+    with rasterio.open(geotiff) as src:
+        assert src.profile["compress"] == "zstd"
+        assert src.block_shapes[0] == (256, 256)
+        assert src.overviews(1)
+        assert (src.read() == before).all()
+    # only the converted file is left behind
+    assert [p.name for p in tmp_path.iterdir()] == ["image.tif"]
+
+
+def test_tiled_fallback_writes_overviews(geotiff, tmp_path):
+    import rasterio
+
+    out = str(tmp_path / "out.tif")
+    cog._copy_tiled(geotiff, out, "deflate", 6, None, 256, True, "average")
+    with rasterio.open(out) as src:
+        assert src.profile["compress"] == "deflate"
+        assert src.block_shapes[0] == (256, 256)
+        assert src.overviews(1) == [2, 4]
+
+
+def test_convert_spawns_workers_from_threads(geotiff):
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        result = executor.submit(cog.convert, [geotiff], workers=1).result(60)
+    assert result == [geotiff]
+
+
+def test_convert_rejects_unknown_options(geotiff):
+    with pytest.raises(ValueError):
+        cog.convert([geotiff], compression="zstd")
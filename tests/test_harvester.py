@@ -3,6 +3,7 @@ import os.path
 
 # trunk-ignore(flake8/F401)
 import eemont
+import pandas as pd
 import pytest
 
 from eeharvest import harvester, settings
@@ -69,6 +70,19 @@ def test_preprocess(to_harvest):
     assert to_harvest.spectral == "NDVI"
 
 
+def test_metadata_is_cached_until_image_changes(to_harvest):
+    """collect.metadata: fetched once and refreshed after a new preprocess()"""
+    to_harvest.preprocess(spectral="NDVI")
+    meta = to_harvest.metadata
+    assert meta["count"] == 1
+    assert "NDVI_median" in meta["bands"]
+    assert to_harvest.metadata is meta
+
+    to_harvest.preprocess(reduce=None, spectral="NDVI")
+    assert to_harvest.metadata is not meta
+    assert len(to_harvest.metadata["ids"]) == to_harvest.metadata["count"]
+
+
 def test_map_basically_works(capsys, to_harvest):
     """collect.map: should not produce errors"""
     to_harvest.preprocess(spectral="NDVI")
@@ -119,6 +133,24 @@ def test_map_works_with_imagecollection(capsys, to_harvest):
     assert "previewing first image only" in captured.out
 
 
+def test_sample_extracts_values_at_points(to_harvest, data_path, tmp_path):
+    """collect.sample: writes one row per sampled point to a table"""
+    to_harvest.preprocess(spectral="NDVI")
+    points = pd.DataFrame({"lng": [149.7995, 149.7999], "lat": [-30.3095, -30.3092]})
+    outfile = to_harvest.sample(
+        points=points,
+        bands="NDVI",
+        scale=30,
+        outfile=str(tmp_path.joinpath("points.csv")),
+        colname_lat="lat",
+        colname_lng="lng",
+        chunk_size=1,
+    )
+    df = pd.read_csv(outfile)
+    assert sorted(df["point_id"]) == [0, 1]
+    assert "NDVI_median" in df.columns
+
+
 def test_config_works_with_harvester_module(tmp_path):
     """collect: should work with a config file supplied"""
     harvester.initialise()
@@ -173,6 +205,27 @@ def test_auto_can_handle_multiple_collections(tmp_path):
     assert tif_exists is True
 
 
+def test_auto_runs_profiles_concurrently_in_order(tmp_path):
+    img = harvester.auto(config="tests/data/multi.yaml", outpath=tmp_path, workers=2)
+    assert len(img.obj) == 2
+    assert img.errors == {}
+    assert [i.collection for i in img.obj] == [
+        "LANDSAT/LC09/C02/T1_L2",
+        "LANDSAT/LC08/C02/T1_L2",
+    ]
+
+
+def test_auto_resume_skips_completed_profiles(tmp_path, capsys):
+    first = harvester.auto(config="tests/data/multi.yaml", outpath=tmp_path)
+    assert os.path.isfile(os.path.join(tmp_path, ".eeharvest_journal.json"))
+    capsys.readouterr()
+
+    img = harvester.auto(config="tests/data/multi.yaml", outpath=tmp_path, resume=True)
+    captured = capsys.readouterr()
+    assert captured.out.count("completed by a previous run") == 2
+    assert img.filenames == first.filenames
+
+
 def test_auto_validates_bands_poperly():
     with pytest.raises(ValueError) as excinfo:
         img = harvester.auto(config="tests/data/multi_bad_band.yaml")
@@ -202,3 +255,181 @@ def test_preprocess_stops_if_zero_images_found_in_image_collection():
     with pytest.raises(ValueError) as excinfo:
         img.preprocess()
     assert "No image to process" in str(excinfo.value)
+
+
+def test_collection_download_skips_existing_images(tmp_path):
+    names = ["20221001.tif", "20221017.tif"]
+    for name in names:
+        (tmp_path / name).write_bytes(b"tif")
+    result = harvester._download_images(
+        None, names, None, str(tmp_path), 100, "EPSG:4326", False, 4
+    )
+    assert result == names
+
+
+def test_oversized_requests_are_split_into_tiles():
+    error = Exception(
+        "Total request size (335544320 bytes) must be less than or equal to "
+        "50331648 bytes."
+    )
+    assert harvester._tiles_for_error(error) == [4, 4]
+    assert harvester._tiles_for_error(Exception("Image.select: no band")) is None
+
+
+class _OfflineImage(harvester.ee.image.Image):
+    """An ee.Image stand-in for tests that do not reach Earth Engine"""
+
+    def __init__(self):
+        pass
+
+    def select(self, *args, **kwargs):
+        return self
+
+
+def _offline_collect(config, bands=("NDVI",)):
+    """A config-based collect object with a preprocessed image, offline"""
+    img = harvester.collect.__new__(harvester.collect)
+    img.metrics = harvester.metrics.Metrics()
+    img.config = settings._add_missing_keys(config)
+    img.regions = None
+    img.collection = config["target_sources"]["GEE"]["preprocess"]["collection"]
+    img.ee_image = _OfflineImage()
+    img.aoi = None
+    img.reduce = None
+    img._metadata_source = img.ee_image
+    img._metadata = {"bands": list(bands), "ids": [], "types": {}, "count": 1}
+    return img
+
+
+def _config(tmp_path, **download):
+    return {
+        "outpath": str(tmp_path),
+        "target_bbox": [149.799, -30.31, 149.80, -30.309],
+        "target_res": 6,
+        "date_min": "2022-10-01",
+        "target_sources": {
+            "GEE": {
+                "preprocess": {"collection": "LANDSAT/LC09/C02/T1_L2"},
+                "download": dict({"bands": "NDVI"}, **download),
+            }
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [(True, {}), ({}, {}), ({"compress": "zstd"}, {"compress": "zstd"}), (False, None)],
+)
+def test_download_passes_cog_setting_from_config(tmp_path, value, expected):
+    img = _offline_collect(_config(tmp_path, cog=value))
+    calls = []
+
+    def fake_download_region(*args, **kwargs):
+        calls.append(kwargs)
+        return "file.tif", "file.tif"
+
+    img._download_region = fake_download_region
+    img.download()
+    assert calls[0]["cog_options"] == expected
+
+
+def test_chips_reads_buffer_from_config(tmp_path, monkeypatch):
+    import numpy as np
+
+    points = tmp_path / "points.csv"
+    points.write_text("Long,Lat\n149.7995,-30.3095\n149.7996,-30.3096\n")
+    config = _config(tmp_path, mode="chips")
+    config.update(infile=str(points), colname_lng="Long", colname_lat="Lat")
+    config["target_sources"]["GEE"]["preprocess"].update(buffer=30, bound=True)
+    img = _offline_collect(config)
+    monkeypatch.setattr(harvester.chips, "prepare", lambda image: image)
+    monkeypatch.setattr(
+        harvester.chips,
+        "fetch",
+        lambda image, grid, bands: np.zeros(
+            (len(bands), grid["dimensions"]["height"], grid["dimensions"]["width"]),
+            "float32",
+        ),
+    )
+    outfile = str(tmp_path / "chips")
+    assert img.chips(outfile=outfile) == outfile
+    data = harvester.chips.read_npz(outfile)
+    # 2 x 30 m buffer at a target_res of 6 arcsec (~180 m) is one pixel
+    assert data["chips"].shape == (2, 1, 1, 1)
+
+
+def test_to_numpy_uses_config_bbox(tmp_path, monkeypatch):
+    import numpy as np
+
+    img = _offline_collect(_config(tmp_path))
+    monkeypatch.setattr(harvester.chips, "prepare", lambda image: image)
+    monkeypatch.setattr(
+        harvester.chips,
+        "fetch",
+        lambda image, grid, bands: np.ones(
+            (len(bands), grid["dimensions"]["height"], grid["dimensions"]["width"]),
+            "float32",
+        ),
+    )
+    array, meta = img.to_numpy(scale=30)
+    width, height = harvester.planner.grid_size([149.799, -30.31, 149.80, -30.309], 30)
+    assert array.shape == (1, height, width)
+    assert not np.isnan(array).any()
+    assert meta["bands"] == ["NDVI"]
+    assert meta["transform"].c == 149.799
+
+
+def test_oversized_collection_images_are_tiled(tmp_path, monkeypatch):
+    class Collection:
+        def filter(self, condition):
+            return self
+
+        def first(self):
+            return "image"
+
+    def too_large(*args, **kwargs):
+        raise harvester.ee.EEException(
+            "Total request size (100000000 bytes) must be less than or equal "
+            "to 50331648 bytes."
+        )
+
+    tiled = []
+
+    def fake_tiles(image, region, path, scale, crs, tiles, *args, **kwargs):
+        tiled.append(tiles)
+        with open(path, "wb") as f:
+            f.write(b"tif")
+
+    monkeypatch.setattr(harvester.ee.Filter, "eq", lambda *args: None)
+    monkeypatch.setattr(harvester.ee, "Image", lambda image: image)
+    monkeypatch.setattr(harvester, "_fetch_tif", too_large)
+    monkeypatch.setattr(harvester, "_download_tiles", fake_tiles)
+    names = ["20221001.tif"]
+    harvester._download_images(
+        Collection(),
+        names,
+        None,
+        str(tmp_path),
+        100,
+        "EPSG:4326",
+        False,
+        2,
+        pixel_type=("float32", harvester.NODATA),
+    )
+    assert tiled == [[2, 2]]
+    assert (tmp_path / "20221001.tif").exists()
+
+
+def test_auto_async_forwards_plan_only(monkeypatch):
+    import asyncio
+
+    calls = []
+
+    def fake_auto(config, outpath, workers, resume, cancel=None, plan_only=False):
+        calls.append((config, plan_only, cancel is not None))
+        return "planned"
+
+    monkeypatch.setattr(harvester, "auto", fake_auto)
+    result = asyncio.run(harvester.auto_async("config.yaml", plan_only=True))
+    assert result == "planned"
+    assert calls == [("config.yaml", True, True)]
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+
+# Modules that are slow to import and should only be loaded when needed
+HEAVY_MODULES = ["ee", "eemont", "geemap", "pandas", "rasterio", "tqdm", "yamale"]
+
+
+def _run(code):
+    """Run python code in a fresh interpreter and return what it prints"""
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    return result.stdout.strip()
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = (
+        "import sys, eeharvest; "
+        f"print([m for m in {HEAVY_MODULES} if m in sys.modules])"
+    )
+    assert _run(code) == "[]"
+
+
+def test_import_time_stays_low():
+    """A bare `import eeharvest` should take well under a second"""
+    code = (
+        "import time; start = time.perf_counter(); import eeharvest; "
+        "print(time.perf_counter() - start)"
+    )
+    # Take the best of a few runs to smooth out noise on busy machines
+    assert min(float(_run(code)) for _ in range(3)) < 0.5
+
+
+def test_harvester_functions_are_loaded_on_first_use():
+    code = "import eeharvest; print(eeharvest.collect.__module__)"
+    assert _run(code) == "eeharvest.harvester"
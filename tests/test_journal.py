@@ -0,0 +1,41 @@
+import pytest
+
+from eeharvest import journal
+
+
+def test_profile_key_depends_on_content():
+    """profile_key: equal profiles share a key, different ones do not"""
+    a = {"target_res": 6, "target_sources": {"GEE": {"collection": "A"}}}
+    b = {"target_sources": {"GEE": {"collection": "A"}}, "target_res": 6}
+    c = {"target_res": 6, "target_sources": {"GEE": {"collection": "B"}}}
+    assert journal.profile_key(a) == journal.profile_key(b)
+    assert journal.profile_key(a) != journal.profile_key(c)
+
+
+def test_journal_records_profile_and_tile_states(tmp_path):
+    """Journal: states are saved to disk and read back by a new journal"""
+    job = journal.Journal(str(tmp_path))
+    job.update("p1", "planned", number=1)
+    job.update("p2", "downloading", number=2)
+    job.tile("p2", "tile_0000.tif", "done")
+    job.tile("p2", "tile_0001.tif", "failed")
+
+    output = tmp_path.joinpath("ee_LANDSAT_0123456789abcdef.tif")
+    output.write_bytes(b"0")
+    job.update("p1", "done", filenames=[output.name], destination=str(output))
+
+    job = journal.Journal(str(tmp_path))
+    assert job.profiles["p2"]["state"] == "downloading"
+    assert job.profiles["p2"]["tiles"]["tile_0001.tif"] == "failed"
+    assert job.completed("p1")["filenames"] == [output.name]
+    assert job.completed("p2") is None
+
+    # A profile is only complete if its output is still on disk
+    output.unlink()
+    assert job.completed("p1") is None
+
+
+def test_journal_rejects_unknown_states(tmp_path):
+    job = journal.Journal(str(tmp_path))
+    with pytest.raises(ValueError):
+        job.update("p1", "finished")
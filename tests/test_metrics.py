@@ -0,0 +1,56 @@
+import json
+
+from eeharvest import metrics, utils
+
+
+class FakeRequest:
+    """Stands in for an Earth Engine object"""
+
+    def getInfo(self):
+        return 42
+
+
+class Stage:
+    def __init__(self):
+        self.metrics = metrics.Metrics()
+
+    @metrics.timed("work")
+    def work(self, n):
+        # requests made in worker threads count towards the same object
+        return list(
+            utils._imap_unordered(lambda _: utils._getinfo(FakeRequest()), range(n))
+        )
+
+
+def test_timed_records_stages_and_getinfo_calls_from_threads():
+    stage = Stage()
+    assert stage.work(5) == [42] * 5
+    stage.work(2)
+    data = stage.metrics.as_dict()
+    assert data["stages"]["work"]["calls"] == 2
+    assert data["getinfo_calls"] == 7
+    # nothing is recorded outside of a stage
+    utils._getinfo(FakeRequest())
+    assert stage.metrics.getinfo_calls == 7
+
+
+def test_merge_and_write_metrics(tmp_path):
+    first, second = metrics.Metrics(), metrics.Metrics()
+    first.add_stage("download", 1.5)
+    first.add_bytes(100)
+    second.add_stage("download", 0.5)
+    second.add_cache(hit=True)
+    second.add_cache(hit=False)
+    combined = metrics.Metrics().merge(first).merge(second)
+    assert combined.stages["download"] == {"calls": 2, "seconds": 2.0}
+
+    path = combined.to_json(str(tmp_path / "metrics.json"))
+    with open(path) as f:
+        assert json.load(f)["bytes_downloaded"] == 100
+
+    path = combined.to_prometheus(str(tmp_path / "metrics.prom"), {"job": "test"})
+    with open(path) as f:
+        text = f.read()
+    assert 'eeharvest_stage_seconds_total{stage="download",job="test"} 2.0' in text
+    assert 'eeharvest_cache_hits_total{job="test"} 1' in text
+    assert "# TYPE eeharvest_downloaded_bytes_total counter" in text
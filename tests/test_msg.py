@@ -36,3 +36,27 @@ def test_spin():
         out = "OK, spin works"
         s()
     assert out == "OK, spin works"
+
+
+def test_prefix_tags_messages_and_quietens_spin(capsys):
+    with msg.prefix("Profile 2"):
+        msg.info("The 7-th Fibonacci number is 13")
+        with msg.spin("Checking if spin is quiet") as s:
+            s()
+    msg.info("No tag here")
+    captured = capsys.readouterr()
+    assert "[Profile 2] ℹ The 7-th" in captured.out
+    assert "Checking if spin is quiet done in" in captured.out
+    assert "[Profile 2] ℹ No tag" not in captured.out
+
+
+def test_nested_prefix_restores_outer_tag(capsys):
+    with msg.prefix("Profile 1"):
+        with msg.prefix("Tile 3"):
+            msg.info("Inner")
+        msg.info("Outer")
+    msg.info("None")
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith("[Tile 3]")
+    assert lines[1].startswith("[Profile 1]")
+    assert lines[2].startswith("ℹ")
@@ -0,0 +1,32 @@
+from eeharvest import planner
+
+
+def test_grid_size_converts_degrees_to_pixels():
+    assert planner.grid_size([149.0, -31.0, 150.0, -30.0], 111319.49) == (1, 1)
+    assert planner.grid_size([149.0, -31.0, 150.0, -30.5], 100) == (1114, 557)
+
+
+def test_tile_layout_stays_under_limits():
+    # small images are downloaded in one request
+    assert planner.tile_layout(1000, 1000, 4) == [1, 1]
+    # grids are split along their longer side first
+    ncol, nrow = planner.tile_layout(8000, 2000, 8)
+    assert ncol > nrow
+    assert -(-8000 // ncol) * -(-2000 // nrow) * 8 <= planner.MAX_REQUEST_BYTES
+    # the pixel grid of a request is limited even for tiny pixels
+    assert planner.tile_layout(25000, 100, 1) == [3, 1]
+
+
+def test_estimate_counts_bytes_of_all_images():
+    bpp = planner.BYTES_PER_BAND * 2
+    plan = planner.estimate([149.0, -31.0, 150.0, -30.0], 30, bpp, images=3)
+    assert plan["bytes"] == plan["width"] * plan["height"] * 8 * 3
+    assert plan["tiles"][0] * plan["tiles"][1] > 1
+
+
+def test_windows_cover_the_grid():
+    windows = planner.windows(10, 7, [3, 2])
+    assert len(windows) == 6
+    assert windows[0] == (0, 0, 4, 4)
+    assert windows[-1] == (8, 4, 2, 3)
+    assert sum(w * h for _, _, w, h in windows) == 70
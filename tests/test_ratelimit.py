@@ -0,0 +1,88 @@
+import multiprocessing
+import sys
+import time
+
+import pytest
+
+from eeharvest import ratelimit
+
+
+@pytest.fixture
+def bucket(tmp_path, monkeypatch):
+    """A shared bucket of one token that refills at 50 requests per second"""
+    monkeypatch.setenv("EEHARVEST_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("EEHARVEST_RATE_LIMIT", "50")
+    monkeypatch.setenv("EEHARVEST_RATE_BURST", "1")
+    monkeypatch.setattr(ratelimit.time, "sleep", _fast_sleep)
+    return tmp_path
+
+
+_real_sleep = time.sleep
+
+
+def _fast_sleep(seconds):
+    # Backoff delays are skipped, but the bucket still has to refill
+    _real_sleep(min(seconds, 0.05))
+
+
+def _acquire_many(n):
+    for _ in range(n):
+        ratelimit.acquire()
+
+
+def test_is_retryable_matches_quota_errors():
+    assert ratelimit.is_retryable(Exception("Too many concurrent aggregations."))
+    assert ratelimit.is_retryable(ConnectionResetError())
+    assert not ratelimit.is_retryable(ValueError("Image.select: Band not found"))
+
+
+def test_computation_timeouts_are_not_retried(bucket):
+    assert ratelimit.is_retryable(TimeoutError("The read operation timed out"))
+    assert not ratelimit.is_retryable(
+        Exception("An internal error has occurred (request: 1234).")
+    )
+    attempts = []
+
+    def slow():
+        attempts.append(1)
+        raise Exception("Computation timed out.")
+
+    with pytest.raises(Exception, match="Computation timed out"):
+        ratelimit.call(slow)
+    assert len(attempts) == 1
+
+
+def test_call_retries_retryable_errors(bucket):
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Exception("429 Client Error: Too Many Requests")
+        return "ok"
+
+    assert ratelimit.call(flaky, base_delay=0.01) == "ok"
+    assert len(attempts) == 3
+
+    def broken():
+        attempts.append(1)
+        raise ValueError("Invalid argument")
+
+    with pytest.raises(ValueError):
+        ratelimit.call(broken)
+    assert len(attempts) == 4
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="needs fork and fcntl")
+def test_bucket_is_shared_between_processes(bucket):
+    start = time.perf_counter()
+    processes = [
+        multiprocessing.get_context("fork").Process(target=_acquire_many, args=(5,))
+        for _ in range(2)
+    ]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    # 10 requests with one token to start with need at least 9 refills
+    assert time.perf_counter() - start >= 9 / 50
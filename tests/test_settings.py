@@ -77,3 +77,140 @@ def test_add_missing_keys(data_path):
 
     assert newconfig["target_sources"]["GEE"]["preprocess"]["buffer"] is None
     assert newconfig["target_sources"]["GEE"]["preprocess"]["bound"] is None
+
+
+def test_iter_points_yields_chunks_with_point_ids(data_path):
+    infile = data_path.joinpath("Pointdata_Llara.csv")
+    chunks = list(settings._iter_points(infile, "Long", "Lat", chunksize=100))
+    assert [len(i) for i in chunks] == [100, 100, 100, 11]
+    assert list(chunks[0].columns) == ["point_id", "Long", "Lat"]
+    assert chunks[-1]["point_id"].iloc[-1] == 310
+
+
+def test_iter_points_explains_missing_pyarrow(monkeypatch):
+    import sys
+
+    monkeypatch.setitem(sys.modules, "pyarrow.parquet", None)
+    with pytest.raises(ImportError, match="requires `pyarrow`"):
+        next(settings._iter_points("points.parquet", "Long", "Lat", 100))
+
+
+def test_validate_bbox_reads_extent_from_infile_in_chunks(data_path):
+    config = {
+        "infile": str(data_path.joinpath("Pointdata_Llara.csv")),
+        "colname_lat": "Lat",
+        "colname_lng": "Long",
+        "target_bbox": None,
+    }
+    bbox = settings._validate_bbox(config, buffer=0)
+    assert settings._infile_extent(config["infile"], "Long", "Lat", 10) == list(bbox)
+    assert bbox[0] < bbox[2] and bbox[1] < bbox[3]
+
+    # infile is not read at all if target_bbox is set
+    config.update(infile="does/not/exist.csv", target_bbox=[1, 2, 3, 4])
+    assert settings._validate_bbox(config) == [1, 2, 3, 4]
+
+
+def test_cluster_points_splits_distant_groups():
+    import pandas as pd
+
+    points = pd.DataFrame(
+        {
+            "lng": [150.00, 150.02, 150.04, 153.00, 153.01],
+            "lat": [-30.00, -30.01, -30.03, -28.00, -28.02],
+        }
+    )
+    clusters = settings._cluster_points(points, "lng", "lat", 0.1, buffer=0)
+    assert [i["points"] for i in clusters] == [3, 2]
+    assert clusters[0]["id"] == "cluster_000"
+    assert clusters[0]["bbox"] == [150.0, -30.03, 150.04, -30.0]
+
+    # a single large cell puts every point in one cluster
+    assert len(settings._cluster_points(points, "lng", "lat", 5)) == 1
+
+
+def test_read_caches_until_the_file_changes(tmpdir):
+    path = tmpdir.join("config.yaml")
+    path.write("target_res: 6\n")
+    config = settings.read(str(path))
+    config["target_res"] = 1
+    assert settings.read(str(path))["target_res"] == 6
+    path.write("target_res: 12\n")
+    assert settings.read(str(path))["target_res"] == 12
+
+
+def test_validate_schema_compiles_schema_once():
+    config = settings.read("tests/data/template.yaml")
+    assert settings.validate_schema(config) is True
+    assert settings._schema() is settings._schema()
+
+
+def test_parse_regions_reads_bboxes_and_feature_collections():
+    assert settings._parse_regions([149.0, -31.0, 150.0, -30.0]) is None
+    assert settings._parse_regions([[149.0, -31.0], [150.0, -30.0]]) is None
+    regions = settings._parse_regions([[149, -31, 150, -30], [151, -32, 152, -31]])
+    assert [r["id"] for r in regions] == ["region_000", "region_001"]
+    assert settings._regions_bbox(regions) == [149, -32, 152, -30]
+    features = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "id": "paddock 1",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[149, -31], [150, -31], [150, -30], [149, -31]]],
+                },
+            },
+            {
+                "type": "Feature",
+                "properties": {"name": "north"},
+                "geometry": {"type": "Point", "coordinates": [151, -29]},
+            },
+        ],
+    }
+    regions = settings._parse_regions(features)
+    assert regions[0]["id"] == "paddock_1"
+    assert regions[0]["bbox"] == [149.0, -31.0, 150.0, -30.0]
+    assert regions[0]["geometry"] == features["features"][0]["geometry"]
+    assert regions[1]["id"] == "region_001"
+    assert regions[1]["bbox"] == [151.0, -29.0, 151.0, -29.0]
+
+
+def test_read_features_from_file(tmpdir):
+    path = tmpdir.join("zones.geojson")
+    path.write(
+        '{"type": "FeatureCollection", "features": ['
+        '{"type": "Feature", "properties": {"id": 7},'
+        ' "geometry": {"type": "Point", "coordinates": [149, -30]}},'
+        '{"type": "Feature", "properties": {},'
+        ' "geometry": {"type": "Point", "coordinates": [150, -30]}}]}'
+    )
+    zones = settings._read_features(str(path))
+    assert [id for id, _ in zones] == ["7", "zone_001"]
+    assert zones[0][1]["type"] == "Point"
+
+
+def test_validate_schema_rejects_zero_cluster_size():
+    """
+    validate_schema: should reject a `cluster_size` of 0, which
+    `_cluster_points()` cannot use
+    """
+    raw = """
+target_res: 6
+date_min: 2022-10-01
+cluster_size: {}
+target_sources:
+  GEE:
+    preprocess:
+      collection: LANDSAT/LC09/C02/T1_L2
+      mask_clouds: True
+      reduce: median
+    download:
+      bands: NDVI
+    """
+    config = yaml.load(raw.format(0.05), Loader=yaml.FullLoader)
+    assert settings.validate_schema(config) is True
+    config = yaml.load(raw.format(0), Loader=yaml.FullLoader)
+    with pytest.raises(ValueError, match="Error validating"):
+        settings.validate_schema(config)
@@ -2,15 +2,7 @@ import os
 
 import pytest
 
-from eeharvest import harvester, utils
-
-
-def test_suppress_stdout(capsys):
-    """Test the suppress_stdout function"""
-    with utils._suppress():
-        print("This should not be printed")
-    captured = capsys.readouterr()
-    assert "This should not be printed" not in captured.out
+from eeharvest import harvester, settings, utils
 
 
 def test_get_indices():
@@ -29,6 +21,17 @@ def test_imageID_to_tifID(ee_imagecollection):
     assert type(utils._imageID_to_tifID(ee_imagecollection)) is list
 
 
+def test_describe_returns_metadata_in_one_dict(ee_imagecollection):
+    """
+    Test that the describe function returns the image count, band names, image
+    IDs and projection of an ee.ImageCollection
+    """
+    info = utils._describe(ee_imagecollection)
+    assert info["count"] == len(info["ids"])
+    assert "SR_B1" in info["bands"]
+    assert "crs" in info["projection"]
+
+
 def test_validate_collection():
     """
     Test that the validate_collection function returns True if the collection
@@ -193,3 +196,238 @@ def test_download_tif_multiple_images(tmpdir, ee_imagecollection, coords):
         if path.is_file():
             count += 1
     assert count == 2
+
+
+def test_split_bbox_produces_grid_of_tiles(coords):
+    """
+    Test that the split_bbox function returns the requested number of tiles
+    and that the tiles cover the original bounding box
+    """
+    tiles = utils._split_bbox(coords, 2)
+    assert len(tiles) == 4
+    assert len(utils._split_bbox(coords, [3, 2])) == 6
+    assert min(i[0] for i in tiles) == coords[0]
+    assert min(i[1] for i in tiles) == coords[1]
+    assert max(i[2] for i in tiles) == coords[2]
+    assert max(i[3] for i in tiles) == coords[3]
+
+
+def test_table_writer_appends_batches_to_csv(tmp_path):
+    """
+    Test that the TableWriter class writes batches of records to a single csv
+    file, and only creates the file once it is closed
+    """
+    outfile = str(tmp_path.joinpath("table.csv"))
+    with utils._TableWriter(outfile) as table:
+        table.write([{"point_id": 0, "NDVI": 0.5}])
+        table.write([{"point_id": 1, "NDVI": 0.6}, {"point_id": 2, "NDVI": 0.7}])
+        assert not os.path.exists(outfile)
+    with open(outfile) as f:
+        assert f.read().splitlines() == [
+            "point_id,NDVI",
+            "0,0.5",
+            "1,0.6",
+            "2,0.7",
+        ]
+    assert table.rows == 3
+
+
+def test_match_bands_handles_reduced_band_names():
+    all_bands = ["NDVI_median", "SR_B1_median", "SR_B2_median"]
+    assert utils._match_bands(all_bands, "NDVI", "median") == ["NDVI_median"]
+    assert utils._match_bands(all_bands, ["SR_B1"], None) == ["SR_B1"]
+
+
+def test_run_async_cancels_and_waits_for_cleanup(tmp_path):
+    import asyncio
+    import threading
+
+    part = tmp_path / "image.part.tif"
+    started = threading.Event()
+
+    def slow_download(cancel=None):
+        part.write_text("partial")
+        started.set()
+        while True:
+            try:
+                utils._check_cancelled(cancel)
+            except Exception:
+                part.unlink()
+                raise
+            cancel.wait(0.01)
+
+    async def main():
+        task = asyncio.ensure_future(utils._run_async(slow_download, cancellable=True))
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # partial file is gone by the time the cancellation arrives
+        assert not part.exists()
+        assert await utils._run_async(sum, [1, 2, 3]) == 6
+
+    asyncio.run(main())
+
+
+def test_periods_follow_the_calendar():
+    months = utils._periods("2022-10-15", "2023-01-10", "month")
+    assert [label for label, _, _ in months] == [
+        "2022_10",
+        "2022_11",
+        "2022_12",
+        "2023_01",
+    ]
+    # first and last periods are cut to the date range
+    assert str(months[0][1]) == "2022-10-15" and str(months[-1][2]) == "2023-01-10"
+
+    seasons = utils._periods(2022, 2023, "season")
+    assert [label for label, _, _ in seasons] == [
+        "2021_DJF",
+        "2022_MAM",
+        "2022_JJA",
+        "2022_SON",
+        "2022_DJF",
+    ]
+    assert len(utils._periods("2022-01-01", "2022-01-20", "week")) == 3
+    with pytest.raises(ValueError):
+        utils._periods("2022-01-01", "2022-01-20", "day")
+
+
+def test_cloud_property_depends_on_collection():
+    assert utils._cloud_property("COPERNICUS/S2_SR") == "CLOUDY_PIXEL_PERCENTAGE"
+    assert utils._cloud_property("LANDSAT/LC09/C02/T1_L2") == "CLOUD_COVER"
+    assert utils._cloud_property("MODIS/061/MOD13Q1") is None
+
+
+def test_zonal_columns_follow_earth_engine_names():
+    assert utils._zonal_columns(["NDVI"], ["mean", "p90"]) == {
+        "mean": "NDVI_mean",
+        "p90": "NDVI_p90",
+    }
+    assert utils._zonal_columns(["B1", "B2"], ["mean"]) == {
+        "B1": "B1_mean",
+        "B2": "B2_mean",
+    }
+    assert utils._zonal_columns(["B1", "B2"], ["min", "max"])["B2_max"] == "B2_max"
+
+
+def test_to_long_has_one_row_per_band():
+    features = [
+        {"properties": {"point_id": 0, "date": "2022-10-01", "B1": 1, "B2": 0.5}},
+        {"properties": {"point_id": 1, "date": "2022-10-01", "B1": 2}},
+    ]
+    records = utils._to_long(features, ["B1", "B2"])
+    assert len(records) == 3
+    assert records[1] == {
+        "point_id": 0,
+        "date": "2022-10-01",
+        "band": "B2",
+        "value": 0.5,
+    }
+
+
+def test_time_windows_keep_equal_timestamps_together():
+    windows = utils._time_windows([5, 1, 2, 2, 2, 3], 3)
+    assert windows == [(1, 2, 1), (2, 3, 3), (3, 6, 2)]
+    assert sum(n for _, _, n in windows) == 6
+    assert utils._time_windows([7, 7, 7], 2) == [(7, 8, 3)]
+    assert utils._time_windows([], 2) == []
+
+
+class _FakeReducer:
+    def __init__(self, outputs, inputs=("input",)):
+        self.outputs = list(outputs)
+        self.inputs = list(inputs)
+
+    def getInputs(self):
+        return self.inputs
+
+    def getOutputs(self):
+        return self.outputs
+
+    def combine(self, other, sharedInputs=False):
+        return _FakeReducer(self.outputs + other.outputs)
+
+
+def _fake_reducers(monkeypatch):
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(
+        utils.ee,
+        "Reducer",
+        SimpleNamespace(
+            mean=lambda: _FakeReducer(["mean"]),
+            minMax=lambda: _FakeReducer(["min", "max"]),
+            min=lambda: _FakeReducer(["min"]),
+            linearFit=lambda: _FakeReducer(["scale", "offset"], ["x", "y"]),
+            percentile=lambda p, names: _FakeReducer(names),
+        ),
+    )
+    monkeypatch.setattr(utils.ee, "List", lambda x: x)
+    monkeypatch.setattr(utils.ee, "Dictionary", lambda x: x)
+    monkeypatch.setattr(utils, "_getinfo", lambda x: x)
+
+
+def test_zonal_reducer_expands_multiple_outputs(monkeypatch):
+    _fake_reducers(monkeypatch)
+    reducer, outputs = utils._zonal_reducer(["mean", "minMax", "p90"])
+    assert outputs == ["mean", "min", "max", "p90"]
+    assert reducer.outputs == outputs
+    assert utils._zonal_columns(["NDVI"], outputs)["max"] == "NDVI_max"
+    with pytest.raises(ValueError, match="same output"):
+        utils._zonal_reducer(["min", "minMax"])
+    with pytest.raises(ValueError, match="2 inputs"):
+        utils._zonal_reducer(["linearFit"])
+
+
+def test_table_writer_keeps_declared_types(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    outfile = str(tmp_path.joinpath("table.parquet"))
+    dtypes = {"NDVI_mean": "float64"}
+    with utils._TableWriter(outfile, dtypes=dtypes) as table:
+        table.write([{"zone_id": "a"}, {"zone_id": "b", "NDVI_mean": None}])
+        table.write([{"zone_id": "c", "NDVI_mean": 0.5}])
+    result = pq.read_table(outfile)
+    assert result.column_names == ["zone_id", "NDVI_mean"]
+    assert str(result.schema.field("NDVI_mean").type) == "double"
+    assert result.column("NDVI_mean").to_pylist() == [None, None, 0.5]
+
+
+def test_region_geometry_keeps_feature_polygons():
+    triangle = {
+        "type": "Polygon",
+        "coordinates": [[[149, -31], [150, -31], [150, -30], [149, -31]]],
+    }
+    features = {
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": "a", "geometry": triangle}],
+    }
+    region = settings._parse_regions(features)[0]
+    assert utils._region_geometry(region) == triangle
+    region = settings._parse_regions([[149, -31, 150, -30], [151, -32, 152, -31]])[0]
+    assert utils._region_geometry(region) == {
+        "type": "Polygon",
+        "coordinates": [[[149, -31], [150, -31], [150, -30], [149, -30], [149, -31]]],
+    }
+
+
+def test_pixel_type_keeps_integer_bands():
+    def int_type(low, high):
+        return {"type": "PixelType", "precision": "int", "min": low, "max": high}
+
+    assert utils._pixel_type([int_type(0, 100)]) == ("uint8", 255)
+    assert utils._pixel_type([int_type(0, 255)]) == ("uint16", 65535)
+    assert utils._pixel_type([int_type(-32768, 100)]) == ("int32", -(2**31))
+    assert utils._pixel_type([int_type(-100, 100), int_type(0, 10)]) == (
+        "int8",
+        -128,
+    )
+    assert utils._pixel_type([int_type(-(2**31), 2**31 - 1)]) == (
+        "float64",
+        utils.NODATA,
+    )
+    floats = [int_type(0, 100), {"type": "PixelType", "precision": "float"}]
+    assert utils._pixel_type(floats) == ("float32", utils.NODATA)
+    assert utils._pixel_type([{"precision": "double"}]) == ("float64", utils.NODATA)
+    assert utils._pixel_type([]) == ("float32", utils.NODATA)